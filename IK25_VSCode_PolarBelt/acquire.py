@@ -0,0 +1,147 @@
+import asyncio
+import sys
+
+from pylsl import StreamInfo, StreamOutlet, local_clock
+
+from instrumentation import INSTRUMENTS
+from pmd import PMD_ECG, decode_ecg, parse_header
+from sensor_clock import SensorClock
+
+# -----------------------------------------------------------------------------------
+# BLE ACQUISITION
+# Polar H10 ECG to an LSL outlet. Needs bleak and pylsl but no scipy or matplotlib,
+# so an acquisition-only process starts fast and stays small.
+# -----------------------------------------------------------------------------------
+
+# -----------------------------------------------------------------------------------
+# POLAR UUIDS
+# -----------------------------------------------------------------------------------
+MODEL_NBR_UUID = "00002a24-0000-1000-8000-00805f9b34fb"
+MANUFACTURER_NAME_UUID = "00002a29-0000-1000-8000-00805f9b34fb"
+BATTERY_LEVEL_UUID = "00002a19-0000-1000-8000-00805f9b34fb"
+PMD_CONTROL = "FB005C81-02E7-F387-1CAD-8ACD2D8DF0C8"
+PMD_DATA = "FB005C82-02E7-F387-1CAD-8ACD2D8DF0C8"
+ECG_WRITE = bytearray([0x02, 0x00, 0x00, 0x01, 0x82, 0x00, 0x01, 0x01, 0x0E, 0x00])
+ECG_SAMPLING_FREQ = 130
+
+OUTLET = None  # Will be our ECG data outlet
+SENSOR_CLOCK = None  # Maps PMD sensor timestamps onto local_clock()
+
+# -----------------------------------------------------------------------------------
+# LSL STREAM SETUP
+# -----------------------------------------------------------------------------------
+def StartStream(stream_name, source_id='myuid2424'):
+    info = StreamInfo(stream_name, 'ECG', 1, ECG_SAMPLING_FREQ, 'float32', source_id)
+    info.desc().append_child_value("manufacturer", "Polar")
+    channels = info.desc().append_child("channels")
+    for c in ["ECG"]:
+        channels.append_child("channel") \
+            .append_child_value("name", c) \
+            .append_child_value("unit", "microvolts") \
+            .append_child_value("type", "ECG")
+    return StreamOutlet(info)
+
+# -----------------------------------------------------------------------------------
+# NOTIFICATION CALLBACK - push samples to LSL
+# -----------------------------------------------------------------------------------
+def push_ecg_frame(outlet, sensor_clock, data):
+    # Runs on the event loop thread, so only the vectorized decode and the push happen here
+    if data and data[0] == PMD_ECG:
+        with INSTRUMENTS.span("decode"):
+            arrival_time = local_clock()
+            _, sensor_timestamp, _ = parse_header(data)
+            ecg = decode_ecg(data)
+            stamps = sensor_clock.timestamps(sensor_timestamp, len(ecg), arrival_time)
+            outlet.push_chunk(ecg, stamps.tolist())
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.count("ble_frames")
+            INSTRUMENTS.count("samples_in", len(ecg))
+            INSTRUMENTS.gauge("lost_samples", sensor_clock.lost_samples)
+            INSTRUMENTS.gauge("sensor_gaps", sensor_clock.gaps)
+
+def data_conv(sender, data: bytearray):
+    push_ecg_frame(OUTLET, SENSOR_CLOCK, data)
+
+# -----------------------------------------------------------------------------------
+# ASYNCHRONOUS TASK: BLE CONNECT AND START NOTIFY
+# -----------------------------------------------------------------------------------
+async def start_ecg(client, callback):
+
+    model_number = await client.read_gatt_char(MODEL_NBR_UUID)
+    print("Model Number: {0}".format("".join(map(chr, model_number))), flush=True)
+
+    manufacturer_name = await client.read_gatt_char(MANUFACTURER_NAME_UUID)
+    print("Manufacturer Name: {0}".format("".join(map(chr, manufacturer_name))), flush=True)
+
+    battery_level = await client.read_gatt_char(BATTERY_LEVEL_UUID)
+    print("Battery Level: {0}%".format(int(battery_level[0])), flush=True)
+
+    await client.read_gatt_char(PMD_CONTROL)
+    print("Collecting GATT data...", flush=True)
+
+    await client.write_gatt_char(PMD_CONTROL, ECG_WRITE)
+    print("Writing GATT data...", flush=True)
+
+    await client.start_notify(PMD_DATA, callback)
+    print("Collecting ECG data...", flush=True)
+
+async def run(client):
+    import aioconsole
+
+    print("---------Looking for Device------------ ", flush=True)
+    await client.is_connected()
+    print("---------Device connected--------------", flush=True)
+
+    await start_ecg(client, data_conv)
+
+    await aioconsole.ainput('Running! Data stream to LSL is live. It will take a moment until data arrives! Press enter to quit...')
+    await client.stop_notify(PMD_DATA)
+    print("Stopping ECG data...", flush=True)
+    print(f"Received {SENSOR_CLOCK.samples} samples in {SENSOR_CLOCK.frames} frames, "
+          f"{SENSOR_CLOCK.lost_samples} samples lost in {SENSOR_CLOCK.gaps} gaps.", flush=True)
+    print("[CLOSED] application closed.", flush=True)
+    sys.exit(0)
+
+# -----------------------------------------------------------------------------------
+# MAIN ASYNC WRAPPER
+# -----------------------------------------------------------------------------------
+async def acquire(device_config, on_stream_started=None):
+    ''' Stream one Polar belt to LSL until Enter is pressed
+
+    Params:
+        device_config (dict) : The [device] section of the configuration
+        on_stream_started (callable) : Called once the ECG outlet exists, e.g. to start the processing
+    '''
+    from bleak import BleakScanner, BleakClient
+    from bleak.exc import BleakError
+
+    global OUTLET, SENSOR_CLOCK
+    OUTLET = StartStream(device_config["stream_name"], device_config["source_id"])
+    SENSOR_CLOCK = SensorClock(ECG_SAMPLING_FREQ)
+
+    final_address = device_config["address"]
+    if not final_address:
+        print("Scanning for Polar device...")
+        devices = await BleakScanner.discover()
+        polar_device = None
+        for d in devices:
+            if d.name and "Polar" in d.name:
+                polar_device = d
+                break
+        if not polar_device:
+            print("No Polar device found. Exiting.")
+            sys.exit(1)
+        final_address = polar_device.address
+        print(f"Found Polar device: {polar_device.name} ({final_address})")
+    else:
+        print(f"Using specified MACADDRESS: {final_address}", flush=True)
+
+    if on_stream_started is not None:
+        on_stream_started()
+
+    try:
+        print("Trying to connect to bluetooth Polarbelt H10 client...")
+        async with BleakClient(final_address) as client:
+            await run(client)
+    except (BleakError, asyncio.TimeoutError, OSError) as error:
+        print(f"Failed to connect to the device: {error}")
@@ -0,0 +1,256 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import timeit
+
+import numpy as np
+
+from hrv import calculate_lf_hf_ratio_welch
+from pan_tompkins import Pan_tompkins
+from pipeline import ProcessingPipeline
+from qrs import QRSBlanker
+from synthetic import match_beats, pmd_ecg_frames, synthetic_ecg
+from utils import interpolate_ECG_peaks
+
+# -----------------------------------------------------------------------------------
+# BENCHMARKS
+# Timings of the ECG/HRV/EMG stages on synthetic signals, plus an R-peak accuracy check,
+# so a speedup cannot silently break detection. test_detection.py runs the same accuracy
+# check under pytest. Results go to JSON for comparing commits:
+#   python benchmark.py --output before.json
+#   python benchmark.py --output after.json --compare before.json
+# -----------------------------------------------------------------------------------
+SAMPLE_RATE = 130
+CHUNK_SIZE = 13  # samples per pull_chunk at the 10 Hz processing rate
+
+# (name, synthetic_ecg options) of the accuracy scenarios
+ACCURACY_SCENARIOS = (
+    ("clean", dict()),
+    ("noisy", dict(noise=80.0)),
+    ("bradycardia", dict(heart_rate=45.0)),
+    ("tachycardia", dict(heart_rate=150.0)),
+    ("irregular", dict(rr_variability=0.15)),
+    ("60 Hz hum", dict(powerline=300.0, powerline_freq=60.0)),
+    ("muscle noise", dict(emg=60.0)),
+    ("500 Hz", dict(sample_rate=500, emg=60.0)),
+)
+
+
+def measure(function, repeat=5, min_time=0.2):
+    ''' Seconds per call of `function`: best, mean and standard deviation over `repeat` runs
+    '''
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(int(number * min_time / 0.2), 1)
+    runs = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return dict(best=float(runs.min()), mean=float(runs.mean()), std=float(runs.std()), calls=number)
+
+
+def bench_fit(results, durations):
+    for duration in durations:
+        _, x, _ = synthetic_ecg(duration)
+        detector = Pan_tompkins(x, SAMPLE_RATE)
+        results.append(("Pan_tompkins.fit", dict(seconds=duration), measure(detector.fit)))
+
+
+def bench_findpeaks(results, durations):
+    for duration in durations:
+        _, x, _ = synthetic_ecg(duration)
+        detector = Pan_tompkins(x, SAMPLE_RATE)
+        integrated = detector.fit()
+        spacing = SAMPLE_RATE // 10
+        results.append(("findpeaks", dict(seconds=duration),
+                         measure(lambda: detector.findpeaks(integrated, spacing=spacing))))
+        results.append(("detect_peaks", dict(seconds=duration), measure(lambda: detector.detect_peaks(integrated))))
+
+
+def bench_stream(results):
+    _, x, _ = synthetic_ecg(60)
+    chunks = [x[i:i + CHUNK_SIZE] for i in range(0, len(x), CHUNK_SIZE)]
+
+    def run():
+        detector = Pan_tompkins(sample_rate=SAMPLE_RATE)
+        detector.start_stream()
+        for chunk in chunks:
+            detector.update(chunk)
+    timing = measure(run, repeat=3)
+    timing = {key: value / len(chunks) if key != "calls" else value for key, value in timing.items()}
+    results.append(("Pan_tompkins.update", dict(chunk=CHUNK_SIZE), timing))
+
+
+def bench_qrs_removal(results, durations):
+    for duration in durations:
+        t, x, beats = synthetic_ecg(duration)
+        peaks = np.round(beats * SAMPLE_RATE).astype(int)
+        results.append(("interpolate_ECG_peaks", dict(seconds=duration),
+                        measure(lambda: interpolate_ECG_peaks(x, 25, SAMPLE_RATE, peaks))))
+        for method in ("interpolate", "template"):
+            def run():
+                blanker = QRSBlanker(SAMPLE_RATE, method=method)
+                blanker.add_peaks(0, peaks)
+                blanker.update(x[np.newaxis, :], 0)
+            results.append(("QRSBlanker.update", dict(seconds=duration, method=method), measure(run)))
+
+
+def bench_lf_hf(results, durations):
+    for duration in durations:
+        _, _, beats = synthetic_ecg(duration)
+        ibi = np.diff(beats)
+        results.append(("calculate_lf_hf_ratio_welch", dict(seconds=duration),
+                        measure(lambda: calculate_lf_hf_ratio_welch(beats[1:], ibi, (0.04, 0.15), (0.15, 0.4)))))
+
+
+def bench_decoder(results):
+    # Same path as data_conv: decode, sensor clock mapping and the push to a real outlet
+    from pylsl import StreamInfo, StreamOutlet
+    from acquire import push_ecg_frame
+    from sensor_clock import SensorClock
+
+    _, x, _ = synthetic_ecg(60)
+    frames = pmd_ecg_frames(x, SAMPLE_RATE)
+    outlet = StreamOutlet(StreamInfo("BenchmarkECG", "Benchmark", 1, SAMPLE_RATE, 'float32', "benchmark_ecg"))
+
+    def run():
+        sensor_clock = SensorClock(SAMPLE_RATE)
+        for frame in frames:
+            push_ecg_frame(outlet, sensor_clock, frame)
+    timing = measure(run, repeat=3)
+    timing = {key: value / len(frames) if key != "calls" else value for key, value in timing.items()}
+    results.append(("data_conv", dict(samples_per_frame=73), timing))
+
+
+def bench_tick(results, plot_lengths, channel_counts):
+    ''' ingest() of one chunk followed by tick(), on a buffer that is already full
+    '''
+    for plot_length in plot_lengths:
+        for channel_count in channel_counts:
+            t, x, _ = synthetic_ecg(plot_length + 30)
+            samples = np.repeat(x[:, np.newaxis], channel_count, axis=1).astype(np.float32)
+            pipeline = ProcessingPipeline(SAMPLE_RATE, channel_count, selected_channels=range(channel_count),
+                                          plot_length=plot_length)
+            warm_up = (len(t) - 30 * SAMPLE_RATE) // CHUNK_SIZE * CHUNK_SIZE
+            for start in range(0, warm_up, CHUNK_SIZE):
+                pipeline.ingest(samples[start:start + CHUNK_SIZE], t[start:start + CHUNK_SIZE])
+            # The last 30 s are fed in a loop, shifted in time on every pass
+            state = dict(start=warm_up, shift=0.0)
+            loop_duration = (len(t) - warm_up) / SAMPLE_RATE
+
+            def run():
+                start = state["start"]
+                if start + CHUNK_SIZE > len(t):
+                    start = warm_up
+                    state["shift"] += loop_duration
+                pipeline.ingest(samples[start:start + CHUNK_SIZE], t[start:start + CHUNK_SIZE] + state["shift"])
+                pipeline.tick()
+                state["start"] = start + CHUNK_SIZE
+            results.append(("tick", dict(plot_length=plot_length, channels=channel_count), measure(run)))
+
+
+def detection_accuracy(options, detector="stream", duration=120.0):
+    ''' Sensitivity and PPV of the streaming or the batch detector on one synthetic scenario
+    '''
+    t, x, beats = synthetic_ecg(duration, **options)
+    sample_rate = options.get("sample_rate", SAMPLE_RATE)
+    if detector == "stream":
+        chunk_size = sample_rate // 10
+        stream = Pan_tompkins(sample_rate=sample_rate)
+        stream.start_stream()
+        peaks = np.concatenate([stream.update(x[i:i + chunk_size]) for i in range(0, len(x), chunk_size)])
+    else:
+        batch = Pan_tompkins(x, sample_rate)
+        peaks = batch.detect_peaks(batch.fit())
+    return match_beats(t[peaks], beats)
+
+
+def check_accuracy(duration=120.0):
+    ''' Sensitivity and PPV of the streaming and the batch detector for every scenario
+    '''
+    accuracy = []
+    for name, options in ACCURACY_SCENARIOS:
+        for detector in ("stream", "batch"):
+            sensitivity, ppv = detection_accuracy(options, detector, duration)
+            accuracy.append(dict(scenario=name, detector=detector, sensitivity=sensitivity, ppv=ppv))
+    return accuracy
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, path):
+    ''' Print the speed ratio against an earlier result file, > 1 means faster now
+    '''
+    with open(path) as f:
+        previous = {(entry["name"], json.dumps(entry["params"], sort_keys=True)): entry
+                    for entry in json.load(f)["timings"]}
+    print(f"\nCompared with {path}:")
+    for entry in results:
+        key = (entry["name"], json.dumps(entry["params"], sort_keys=True))
+        if key in previous:
+            ratio = previous[key]["best"] / entry["best"]
+            print(f"  {entry['name']:<28} {key[1]:<40} {ratio:6.2f}x")
+
+
+def run(quick=False):
+    durations = (10, 60) if quick else (10, 60, 300)
+    plot_lengths = (10,) if quick else (10, 30, 60)
+    channel_counts = (1, 2) if quick else (1, 2, 4)
+
+    timings = []
+    bench_fit(timings, durations)
+    bench_findpeaks(timings, durations)
+    bench_stream(timings)
+    bench_qrs_removal(timings, durations)
+    bench_lf_hf(timings, (60, 300))
+    bench_decoder(timings)
+    bench_tick(timings, plot_lengths, channel_counts)
+
+    return dict(
+        revision=git_revision(),
+        created=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        timings=[dict(name=name, params=params, **timing) for name, params, timing in timings],
+        accuracy=check_accuracy(60.0 if quick else 120.0)
+    )
+
+
+# -----------------------------------------------------------------------------------
+# ENTRY POINT
+# -----------------------------------------------------------------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ECG/HRV/EMG pipeline on synthetic ECG.")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON file of an earlier run to compare against")
+    parser.add_argument("--quick", action="store_true", help="fewer and shorter cases")
+    parser.add_argument("--min-accuracy", type=float, default=0.99,
+                        help="exit with an error when sensitivity or PPV falls below this value")
+    args = parser.parse_args()
+
+    report = run(args.quick)
+    for entry in report["timings"]:
+        params = ", ".join(f"{key}={value}" for key, value in entry["params"].items())
+        print(f"{entry['name']:<28} {params:<40} {entry['best'] * 1e6:12.1f} us")
+    print()
+    failed = False
+    for entry in report["accuracy"]:
+        ok = entry["sensitivity"] >= args.min_accuracy and entry["ppv"] >= args.min_accuracy
+        failed |= not ok
+        print(f"{entry['scenario']:<14} {entry['detector']:<7} sensitivity {entry['sensitivity']:.3f}  "
+              f"PPV {entry['ppv']:.3f}  {'ok' if ok else 'FAILED'}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        compare(report["timings"], args.compare)
+    sys.exit(1 if failed else 0)
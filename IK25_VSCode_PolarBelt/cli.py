@@ -0,0 +1,171 @@
+import argparse
+import sys
+
+from config import dump_config, load_config
+
+# -----------------------------------------------------------------------------------
+# COMMAND LINE
+#   python cli.py run                Polar belt -> LSL -> processing in one process (python main.py)
+#   python cli.py acquire            Polar belt -> LSL, no scipy or matplotlib
+#   python cli.py process --headless ECG stream -> HRV and EMG streams, no bleak or matplotlib
+#   python cli.py hub [address ...]  several belts, one processing process per belt
+#   python cli.py emg-features       Myo EMG stream -> RMS/MAV/ZC/WL stream at display rate
+#   python cli.py replay <folder>    a recording -> LSL, or --batch without LSL
+#   python cli.py record <folder>    the ECG stream -> a recording
+#   python cli.py config             print the effective settings as TOML
+# Every subcommand imports only the modules it needs, so a supervisor that restarts
+# workers pays for a cold start of that part only. main.py, hub.py and recording.py
+# run the same subcommands, so every flag is defined here once.
+# -----------------------------------------------------------------------------------
+def run_command(args, config):
+    import asyncio
+    import signal
+    from main import main
+
+    # Gracefully handle Ctrl+C
+    def handle_sigint(signum, frame):
+        print("Received Ctrl+C, exiting.")
+        sys.exit(0)
+    signal.signal(signal.SIGINT, handle_sigint)
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(main(args.headless, args.backend, config))
+
+
+def acquire_command(args, config):
+    import asyncio
+    from acquire import acquire
+
+    if args.address is not None:
+        config["device"]["address"] = args.address
+    asyncio.run(acquire(config["device"]))
+
+
+def process_command(args, config):
+    from processing import data_processing_main
+
+    data_processing_main(args.headless, args.source_id, args.output_suffix, args.backend, config)
+
+
+def hub_command(args, config):
+    import asyncio
+    from hub import run_hub
+
+    asyncio.run(run_hub(args.addresses, headless=not args.plot, config=config))
+
+
+def emg_features_command(args, config):
+    from emg_features import emg_features_main
+
+    if args.source_id is not None:
+        config["myo"]["source_id"] = args.source_id
+    emg_features_main(config)
+
+
+def replay_command(args, config):
+    from recording import replay
+
+    replay(args.path, args.speed, args.process, args.plot, args.batch, args.output, config)
+
+
+def record_command(args, config):
+    from recording import record
+
+    record(args.path, args.source_id, args.duration)
+
+
+def config_command(args, config):
+    print(dump_config(config), end="")
+
+
+def add_dsp_arguments(parser):
+    parser.add_argument("--headless", action="store_true", help="run without the live plot")
+    parser.add_argument("--backend", choices=["thread", "process"],
+                        help="run the DSP in the processing thread or in a worker process")
+
+
+def build_parser():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help="TOML file with settings that override the defaults in config.py")
+    common.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="override one setting, e.g. --set processing.notch_freq=60.0")
+    common.add_argument("--diagnostics", action="store_true",
+                        help="publish stage timings and latencies on the LSL stream PolarDiagnostics")
+    common.add_argument("--metrics-port", type=int,
+                        help="serve stage timings and latencies in the Prometheus text format on this port")
+
+    parser = argparse.ArgumentParser(description="Polar H10 ECG acquisition and processing.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", parents=[common], help="stream one Polar belt and process it")
+    add_dsp_arguments(run_parser)
+    run_parser.set_defaults(handler=run_command)
+
+    acquire_parser = commands.add_parser("acquire", parents=[common], help="stream one Polar belt to LSL")
+    acquire_parser.add_argument("--address", help="bluetooth address of the belt, an empty string scans for it")
+    acquire_parser.set_defaults(handler=acquire_command)
+
+    process_parser = commands.add_parser("process", parents=[common], help="process an ECG stream from LSL")
+    add_dsp_arguments(process_parser)
+    process_parser.add_argument("--source-id", help="source_id of the ECG stream, default is the first ECG stream")
+    process_parser.add_argument("--output-suffix", default="", help="appended to the names of the output streams")
+    process_parser.set_defaults(handler=process_command)
+
+    hub_parser = commands.add_parser("hub", parents=[common], help="stream and process several Polar belts")
+    hub_parser.add_argument("addresses", nargs="*", help="bluetooth addresses, scans for Polar devices if empty")
+    hub_parser.add_argument("--plot", action="store_true", help="show a live plot per device")
+    hub_parser.set_defaults(handler=hub_command)
+
+    features_parser = commands.add_parser("emg-features", parents=[common],
+                                          help="publish RMS, MAV, ZC and WL of the Myo armband EMG")
+    features_parser.add_argument("--source-id",
+                                 help="source_id of the Myo stream, default is the first 8 channel EMG stream")
+    features_parser.set_defaults(handler=emg_features_command)
+
+    replay_parser = commands.add_parser("replay", parents=[common], help="replay a recording folder or .xdf file")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--speed", type=float, default=1.0, help="replay speed as a multiple of real time")
+    replay_parser.add_argument("--process", action="store_true", help="also run the processing on the replayed stream")
+    replay_parser.add_argument("--plot", action="store_true", help="show the live plot while processing")
+    replay_parser.add_argument("--batch", action="store_true", help="process without LSL as fast as possible")
+    replay_parser.add_argument("--output", help="with --batch, write the results to this .npz file")
+    replay_parser.set_defaults(handler=replay_command)
+
+    record_parser = commands.add_parser("record", parents=[common], help="record the raw ECG outlet to a folder")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--source-id", help="source_id of the ECG stream, default is the first ECG stream")
+    record_parser.add_argument("--duration", type=float, help="seconds to record, default is until Ctrl+C")
+    record_parser.set_defaults(handler=record_command)
+
+    config_parser = commands.add_parser("config", parents=[common], help="print the effective settings as TOML")
+    config_parser.set_defaults(handler=config_command)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    try:
+        config = load_config(args.config, args.set)
+    except (OSError, ValueError) as error:
+        parser.error(f"invalid configuration: {error}")
+
+    diagnostics = args.diagnostics or config["instrumentation"]["diagnostics"]
+    metrics_port = args.metrics_port or config["instrumentation"]["metrics_port"]
+    if args.command != "config" and (diagnostics or metrics_port):
+        from instrumentation import start_instrumentation
+        start_instrumentation(diagnostics, metrics_port)
+
+    try:
+        args.handler(args, config)
+    except KeyboardInterrupt:
+        print("Received Ctrl+C, exiting.")
+    return 0
+
+
+# -----------------------------------------------------------------------------------
+# ENTRY POINT
+# -----------------------------------------------------------------------------------
+if __name__ == "__main__":
+    sys.exit(main())
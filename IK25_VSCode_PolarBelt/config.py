@@ -0,0 +1,174 @@
+import copy
+
+# -----------------------------------------------------------------------------------
+# CONFIG
+# Defaults of all settings. A TOML file with the same sections overrides them, e.g.
+#   [device]
+#   address = ""  # empty: scan for the Polar device
+#   [processing]
+#   notch_freq = 60.0
+# and `--set processing.notch_freq=60.0` on the command line overrides the file.
+# `python cli.py config` prints the complete configuration in this format.
+# -----------------------------------------------------------------------------------
+DEFAULTS = {
+    "device": dict(
+        address="A0:9E:1A:D4:51:BE",  # for ID C0684525, empty to scan for a Polar device
+        stream_name="PolarBand",
+        source_id="myuid2424",
+    ),
+    "processing": dict(
+        compute_rate=10.0,  # Hz
+        plot_length=10,  # seconds
+        EMG_average_window_duration=1.0,  # seconds
+        lf_band=(0.04, 0.15),
+        hf_band=(0.15, 0.4),
+        ecg_channels=[0],  # channels of the ECG stream that are processed, each gets its own metrics and EMG channel
+        frequency_analysis_buffer_duration=60,  # seconds
+        spectrum_hop=5.0,  # seconds between LF/HF updates
+        spectrum_method='welch',  # 'welch' or 'lomb' (Lomb-Scargle, skips resampling)
+        qrs_removal='interpolate',  # 'interpolate' or 'template' (running average beat subtraction)
+        ecg_band=(5.0, 15.0),  # Hz, Pan-Tompkins bandpass
+        notch_freq=50.0,  # Hz, powerline frequency (60.0 in the Americas)
+        filter_order=2,  # Butterworth order of the ECG and EMG bandpass
+        emg_band=(40.0, 450.0),  # Hz, the upper edge is kept below Nyquist
+        min_quality=0.5,  # signal-quality index (0-1) below which HR/HRV/LF-HF and EMG are published as zeros
+        backend='thread',  # 'thread' or 'process' (DSP in a worker process)
+        metrics_resend_interval=1.0,  # seconds, unchanged HR/HRV values are sent again after this, 0 sends every tick
+        max_buffered=10,  # seconds of output an outlet keeps for a slow consumer, hundreds of samples if irregular
+    ),
+    "myo": dict(
+        stream_type="EMG",  # LSL type of the Myo armband stream
+        channel_count=8,
+        source_id="",  # source_id of the Myo stream, empty to take the first stream with the type and channel count
+        sample_rate=200.0,  # Hz, used when the stream has an irregular rate
+        window_duration=0.25,  # seconds of the RMS/MAV/ZC/WL window
+        zero_crossing_threshold=0.0,  # smallest step across zero that counts as a zero crossing
+        output_rate=30.0,  # Hz of the feature stream
+        output_name="EMG_features",
+    ),
+    "instrumentation": dict(
+        diagnostics=False,  # publish stage timings on the LSL stream PolarDiagnostics
+        metrics_port=0,  # serve Prometheus metrics on this port, 0 to disable
+    ),
+}
+
+
+def _toml_loads(text):
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        try:
+            import tomli as tomllib
+        except ImportError:
+            raise ImportError("Reading TOML needs Python 3.11 or tomli: pip install tomli")
+    return tomllib.loads(text)
+
+
+def load_config(path=None, overrides=()):
+    ''' Defaults, updated by the TOML file at `path` and then by `overrides`
+
+    Params:
+        path (str) : TOML file, optional
+        overrides (list) : "section.key=value" strings, values in TOML syntax
+
+    Returns:
+        dict of sections, unknown sections or keys raise a ValueError
+    '''
+    config = copy.deepcopy(DEFAULTS)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            _update(config, _toml_loads(f.read()), path)
+    for override in overrides:
+        name, _, value = override.partition("=")
+        section, _, key = name.strip().partition(".")
+        if not key or not value:
+            raise ValueError(f"Override '{override}' should look like section.key=value")
+        try:
+            parsed = _toml_loads(f"value = {value.strip()}")["value"]
+        except ValueError:
+            parsed = value.strip()  # a bare string
+        _update(config, {section: {key: parsed}}, "--set")
+    return config
+
+
+def _update(config, values, origin):
+    for section, entries in values.items():
+        if section not in config or not isinstance(entries, dict):
+            raise ValueError(f"{origin}: unknown section [{section}]")
+        for key, value in entries.items():
+            if key not in config[section]:
+                raise ValueError(f"{origin}: unknown setting {section}.{key}")
+            config[section][key] = _convert(config[section][key], value, f"{origin}: {section}.{key}")
+
+
+def _convert(default, value, name):
+    ''' `value` with the type of `default`, a ValueError when it does not fit
+
+    TOML has no tuples, so lists are accepted for them, and integers are fine where floats are expected.
+    '''
+    def mismatch(expected):
+        return ValueError(f"{name} expects {expected}, got {value!r}")
+
+    if isinstance(default, (tuple, list)):
+        if not isinstance(value, (tuple, list)):
+            raise mismatch("a list")
+        if isinstance(default, tuple) and len(value) != len(default):
+            raise mismatch(f"a list of {len(default)} values")
+        if default:
+            value = [_convert(default[0], item, name) for item in value]
+        return type(default)(value)
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise mismatch("true or false")
+    elif isinstance(default, int):
+        if isinstance(value, bool) or not isinstance(value, int):
+            raise mismatch("an integer")
+    elif isinstance(default, float):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise mismatch("a number")
+        value = float(value)
+    elif isinstance(default, str) and not isinstance(value, str):
+        raise mismatch("a string")
+    return value
+
+
+def dump_config(config):
+    ''' The configuration as TOML text
+    '''
+    def format_value(value):
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, str):
+            return '"' + value.replace("\\", "\\\\").replace('"', '\\"') + '"'
+        if isinstance(value, (list, tuple)):
+            return "[" + ", ".join(format_value(item) for item in value) + "]"
+        return repr(value)
+
+    lines = []
+    for section, entries in config.items():
+        lines.append(f"[{section}]")
+        lines.extend(f"{key} = {format_value(value)}" for key, value in entries.items())
+        lines.append("")
+    return "\n".join(lines)
+
+
+def pipeline_options(config, selected_channels):
+    ''' ProcessingPipeline settings of a configuration, shared by the live loop and the replay harness
+    '''
+    processing = config["processing"]
+    return dict(
+        selected_channels=selected_channels,
+        plot_length=processing["plot_length"],
+        EMG_average_window_duration=processing["EMG_average_window_duration"],
+        lf_band=processing["lf_band"],
+        hf_band=processing["hf_band"],
+        frequency_analysis_buffer_duration=processing["frequency_analysis_buffer_duration"],
+        spectrum_hop=processing["spectrum_hop"],
+        spectrum_method=processing["spectrum_method"],
+        qrs_removal=processing["qrs_removal"],
+        ecg_band=processing["ecg_band"],
+        notch_freq=processing["notch_freq"],
+        filter_order=processing["filter_order"],
+        emg_band=processing["emg_band"],
+        min_quality=processing["min_quality"]
+    )
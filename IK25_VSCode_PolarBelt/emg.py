@@ -0,0 +1,79 @@
+import numpy as np
+
+from filters import MovingSum, SOSFilter, design_sos, sos_group_delay
+
+# -----------------------------------------------------------------------------------
+# STREAMING EMG ENVELOPE
+# Causal bandpass -> rectification (or squaring) -> moving average over the last window.
+# Already published samples never change, and each call only costs O(new samples).
+# -----------------------------------------------------------------------------------
+def emg_bandpass(sample_rate, lowcut=40.0, highcut=450.0, order=2):
+    ''' Cached Butterworth bandpass in second-order sections, highcut is kept below Nyquist
+    '''
+    highcut = min(highcut, 0.5 * sample_rate - 1)
+    return design_sos('bandpass', (lowcut, highcut), sample_rate, order), (lowcut, highcut)
+
+
+class EMGEnvelope:
+    """ Causal EMG envelope with persistent filter and window state.
+
+    Group delay: the moving average delays the envelope by (window - 1) / 2 samples,
+    the bandpass adds its group delay at the band centre. The sum is available as
+    `group_delay` in seconds, about 0.5 s for a 1 s window.
+
+    Params:
+        sample_rate (int)
+        channel_count (int)
+        window_duration (float) : Length of the moving average in seconds
+        method (str) : 'mean' for the mean absolute value, 'rms' for the root mean square
+        lowcut, highcut (float) : Bandpass edges in Hz
+        order (int) : Butterworth order of the bandpass
+    """
+    def __init__(self, sample_rate, channel_count=1, window_duration=1.0, method='mean', lowcut=40.0, highcut=450.0,
+                 order=2):
+        assert method in ('mean', 'rms'), "method should be 'mean' or 'rms'"
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.method = method
+        self.window_size = max(int(window_duration * sample_rate), 1)
+        self.sos, self.band = emg_bandpass(sample_rate, lowcut, highcut, order)
+        self.group_delay = envelope_group_delay(self.sos, self.band, self.window_size, sample_rate)
+
+        self._bandpass = SOSFilter(self.sos, channel_count)
+        self._window_sum = MovingSum(self.window_size, channel_count)
+
+    def reset(self):
+        ''' Forget the filter and window state, for a restart after a gap in the signal
+        '''
+        self._bandpass.reset()
+        self._window_sum.reset()
+
+    def update(self, samples):
+        ''' Envelope of the new samples
+
+        Params:
+            samples (array): New samples with shape (channels, samples).
+
+        Returns:
+            array: float32 envelope with the same shape.
+        '''
+        samples = np.atleast_2d(np.asarray(samples, dtype=float))
+        count = samples.shape[1]
+        if count == 0:
+            return np.empty((self.channel_count, 0), dtype=np.float32)
+        filtered = self._bandpass(samples)
+        rectified = filtered ** 2 if self.method == 'rms' else np.abs(filtered)
+
+        # Moving average as a running sum continued over the previous call
+        envelope = self._window_sum(rectified) / self.window_size
+        if self.method == 'rms':
+            envelope = np.sqrt(np.maximum(envelope, 0))
+        return envelope.astype(np.float32)
+
+
+def envelope_group_delay(sos, band, window_size, sample_rate):
+    ''' Delay of the envelope in seconds: moving average plus bandpass group delay at the band centre
+    '''
+    centre_freq = np.sqrt(band[0] * band[1])
+    bandpass_delay = sos_group_delay(sos, centre_freq, sample_rate)
+    return ((window_size - 1) / 2 + bandpass_delay) / sample_rate
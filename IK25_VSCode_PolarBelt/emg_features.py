@@ -0,0 +1,145 @@
+import numpy as np
+from pylsl import StreamInfo, StreamOutlet, StreamInlet, resolve_bypred, resolve_byprop
+
+from config import load_config
+from instrumentation import INSTRUMENTS
+from scheduler import ChunkReader, DeadlineClock
+
+# -----------------------------------------------------------------------------------
+# MULTI-CHANNEL EMG FEATURES
+# Sliding window features of the Myo armband EMG: root mean square (RMS), mean absolute
+# value (MAV), zero crossings (ZC) and waveform length (WL). Each sample adds its four
+# contributions to running sums and the sample leaving the window takes them away, so
+# the cost per sample does not depend on the window length or on the output rate.
+# -----------------------------------------------------------------------------------
+FEATURES = ("rms", "mav", "zc", "wl")
+
+
+class EMGFeatures:
+    """ Running-sum RMS, MAV, ZC and WL over the last `window_size` samples of every channel.
+
+    The per-sample contributions (x^2, |x|, zero crossing, |dx|) are kept in a ring, new
+    samples replace the oldest ones and the sums are updated by the difference. Once per
+    window the sums are recomputed from the ring, so rounding errors cannot build up.
+
+    Params:
+        channel_count (int)
+        window_size (int) : Window length in samples
+        zero_crossing_threshold (float) : Smallest step across zero that counts as a crossing,
+            keeps noise around zero from being counted
+    """
+    def __init__(self, channel_count=8, window_size=50, zero_crossing_threshold=0.0):
+        self.channel_count = channel_count
+        self.window_size = window_size
+        self.zero_crossing_threshold = zero_crossing_threshold
+        self._ring = np.zeros((len(FEATURES), channel_count, window_size))
+        self._sums = np.zeros((len(FEATURES), channel_count))
+        self._features = np.zeros((len(FEATURES), channel_count), dtype=np.float32)
+        self._index = 0
+        self._count = 0
+        self._since_resync = 0
+        self._last = None
+
+    def update(self, samples):
+        ''' Add new samples with shape (channels, samples)
+        '''
+        samples = np.asarray(samples, dtype=float).reshape(self.channel_count, -1)
+        count = samples.shape[1]
+        if count == 0:
+            return
+        previous = np.concatenate((samples[:, :1] if self._last is None else self._last, samples[:, :-1]), axis=1)
+        self._last = samples[:, -1:].copy()
+        step = np.abs(samples - previous)
+        contributions = np.stack((
+            samples ** 2,
+            np.abs(samples),
+            (samples * previous < 0) & (step >= self.zero_crossing_threshold),
+            step
+        ))
+
+        # Samples older than one window would only pass through the ring
+        self._count = min(self._count + count, self.window_size)
+        contributions = contributions[..., -self.window_size:]
+        positions = (self._index + np.arange(contributions.shape[-1])) % self.window_size
+        self._sums += contributions.sum(axis=-1) - self._ring[..., positions].sum(axis=-1)
+        self._ring[..., positions] = contributions
+        self._index = (positions[-1] + 1) % self.window_size
+
+        self._since_resync += count
+        if self._since_resync >= self.window_size:
+            self._sums = self._ring.sum(axis=-1)
+            self._since_resync = 0
+
+    def features(self):
+        ''' Current features with shape (4, channels): RMS, MAV, ZC count and WL of the window
+
+        The returned float32 array is reused, the next call overwrites it.
+        '''
+        count = max(self._count, 1)
+        self._features[0] = np.sqrt(np.maximum(self._sums[0], 0) / count)
+        self._features[1] = self._sums[1] / count
+        self._features[2] = np.round(self._sums[2])
+        self._features[3] = self._sums[3]
+        return self._features
+
+
+def features_outlet(channel_count, output_rate, name="EMG_features", source_id="emg_features", max_buffered=10):
+    ''' LSL outlet with one channel per feature and EMG channel, grouped by feature: rms_1 ... wl_8
+    '''
+    info = StreamInfo(name, 'EMGFeatures', len(FEATURES) * channel_count, output_rate, 'float32', source_id)
+    channels = info.desc().append_child("channels")
+    for feature in FEATURES:
+        for channel in range(channel_count):
+            channels.append_child("channel") \
+                .append_child_value("label", f"{feature}_{channel + 1}") \
+                .append_child_value("type", feature.upper())
+    return StreamOutlet(info, chunk_size=1, max_buffered=max_buffered)
+
+# -----------------------------------------------------------------------------------
+# FEATURE SERVER
+# Subscribes to the Myo EMG stream and publishes the features at the display rate.
+# -----------------------------------------------------------------------------------
+def emg_features_main(config=None):
+    if config is None:
+        config = load_config()
+    settings = config["myo"]
+    channel_count = settings["channel_count"]
+
+    if settings["source_id"]:
+        print(f"Looking for EMG stream {settings['source_id']}...")
+        streams = resolve_byprop('source_id', settings["source_id"])
+    else:
+        print(f"Looking for a {channel_count} channel {settings['stream_type']} stream...")
+        streams = resolve_bypred(f"type='{settings['stream_type']}' and channel_count={channel_count}")
+    if not streams:
+        raise RuntimeError("No EMG streams found.")
+
+    inlet = StreamInlet(streams[0])
+    info_inlet = inlet.info()
+    if info_inlet.channel_count() != channel_count:
+        raise RuntimeError(f"Stream {info_inlet.name()} has {info_inlet.channel_count()} channels, "
+                           f"expected {channel_count}.")
+    sample_rate = info_inlet.nominal_srate() or settings["sample_rate"]
+    window_size = max(int(round(settings["window_duration"] * sample_rate)), 1)
+    print(f"Stream {info_inlet.name()}: {channel_count} channels at {sample_rate:g} Hz, "
+          f"window of {window_size} samples, features at {settings['output_rate']:g} Hz.")
+
+    features = EMGFeatures(channel_count, window_size, settings["zero_crossing_threshold"])
+    outlet = features_outlet(channel_count, settings["output_rate"], settings["output_name"])
+    reader = ChunkReader(inlet, max_samples=max(int(sample_rate), 256))
+    clock = DeadlineClock(1.0 / settings["output_rate"], name="feature_tick")
+
+    last_timestamp = None
+    while True:
+        samples, timestamps = reader.pull(timeout=clock.time_left())
+        if len(timestamps) > 0:
+            with INSTRUMENTS.span("emg_features"):
+                features.update(samples.T)
+            last_timestamp = timestamps[-1]
+            INSTRUMENTS.count("myo_samples_in", len(timestamps))
+
+        # At most one output sample per deadline, stamped with the newest EMG sample that went into it
+        if clock.poll() and last_timestamp is not None:
+            outlet.push_chunk(features.features().reshape(1, -1), last_timestamp)
+            last_timestamp = None
+            INSTRUMENTS.count("feature_samples_out")
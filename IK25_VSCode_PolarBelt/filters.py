@@ -0,0 +1,98 @@
+from functools import lru_cache
+
+import numpy as np
+from scipy.signal import butter, group_delay, iirnotch, sos2tf, sosfilt, sosfilt_zi, tf2sos
+
+# -----------------------------------------------------------------------------------
+# FILTER BANK
+# Every filter is designed once per (kind, order, band, sample rate) and kept in
+# second-order sections. SOSFilter adds the per-stream state for causal filtering,
+# MovingSum the running window sum of the moving average stages.
+# -----------------------------------------------------------------------------------
+@lru_cache(maxsize=None)
+def design_sos(kind, band, sample_rate, order=2, quality_factor=30.0):
+    ''' Second-order sections of a Butterworth or notch filter, cached and shared, so never modify them
+
+    Params:
+        kind (str): 'bandpass', 'bandstop', 'lowpass', 'highpass' or 'notch'.
+        band (tuple): Cutoffs in Hz, (low, high) for band filters, (cutoff,) for low/high pass
+            and (frequency,) for the notch.
+        sample_rate (float)
+        order (int): Butterworth order, not used by the notch.
+        quality_factor (float): Quality factor of the notch.
+    '''
+    nyquist = 0.5 * sample_rate
+    normalized = [frequency / nyquist for frequency in band]
+    assert all(0 < frequency < 1 for frequency in normalized), f"{kind} band {band} Hz must lie below {nyquist} Hz"
+    if kind == 'notch':
+        sos = tf2sos(*iirnotch(normalized[0], quality_factor))
+    else:
+        sos = butter(order, normalized if len(normalized) > 1 else normalized[0], btype=kind, output='sos')
+    return sos
+
+
+@lru_cache(maxsize=None)
+def _group_delay(sos_key, frequency, sample_rate):
+    sos = np.array(sos_key)
+    return group_delay(sos2tf(sos), w=[frequency], fs=sample_rate)[1][0]
+
+
+def sos_group_delay(sos, frequency, sample_rate):
+    ''' Group delay in samples of a SOS filter at `frequency` Hz
+    '''
+    return _group_delay(tuple(map(tuple, sos)), frequency, sample_rate)
+
+
+class SOSFilter:
+    """ Causal SOS filter with its own state, for streams that arrive in chunks.
+
+    Params:
+        sos (array) : Second-order sections, usually from design_sos()
+        channel_count (int) : Rows of the (channels, samples) chunks
+        steady_state (bool) : Start as if the first sample had always been there, so a DC
+            offset does not ring. Otherwise the filter starts from rest.
+    """
+    def __init__(self, sos, channel_count=1, steady_state=True):
+        self.sos = sos
+        self.channel_count = channel_count
+        self.steady_state = steady_state
+        self.reset()
+
+    def reset(self):
+        self._zi = None if self.steady_state else np.zeros((self.sos.shape[0], self.channel_count, 2))
+
+    def __call__(self, samples):
+        ''' Filter the next (channels, samples) chunk along the last axis
+        '''
+        if self._zi is None:
+            self._zi = sosfilt_zi(self.sos)[:, np.newaxis, :] * samples[np.newaxis, :, :1]
+        filtered, self._zi = sosfilt(self.sos, samples, axis=-1, zi=self._zi)
+        return filtered
+
+
+class MovingSum:
+    """ Sum over the last `window_size` samples of a stream that arrives in chunks.
+
+    The last window of the previous chunk is carried over, so the sums run on across chunk
+    borders. Before the first `window_size` samples the missing ones count as zeros.
+
+    Params:
+        window_size (int)
+        channel_count (int) : Rows of the (channels, samples) chunks
+    """
+    def __init__(self, window_size, channel_count=1):
+        self.window_size = window_size
+        self.channel_count = channel_count
+        self.reset()
+
+    def reset(self):
+        self._tail = np.zeros((self.channel_count, self.window_size))
+
+    def __call__(self, samples):
+        ''' Window sums ending at every sample of the next (channels, samples) chunk
+        '''
+        count = samples.shape[1]
+        extended = np.concatenate((self._tail, samples), axis=1)
+        cumulative_sum = np.concatenate((np.zeros((self.channel_count, 1)), extended.cumsum(axis=1)), axis=1)
+        self._tail = extended[:, -self.window_size:]
+        return cumulative_sum[:, self.window_size + 1:] - cumulative_sum[:, 1:count + 1]
@@ -0,0 +1,184 @@
+import numpy as np
+from collections import deque
+from scipy.integrate import trapezoid
+from scipy.signal import lombscargle, welch
+
+# -----------------------------------------------------------------------------------
+# HRV HELPERS
+# -----------------------------------------------------------------------------------
+def calculate_lf_hf_ratio_welch(peak_time_points, ibi_values, lf_band, hf_band, fs=4.0):
+    ''' LF and HF power of the IBI series, resampled to `fs` Hz and estimated with Welch's method
+    '''
+    if len(ibi_values) < 4:
+        return 0, 0, 0
+    nn_times = np.asarray(peak_time_points)
+    interp_time = np.arange(nn_times[0], nn_times[-1], 1/fs)
+    if len(interp_time) < 2:
+        return 0, 0, 0
+    interp_nn = np.interp(interp_time, nn_times, ibi_values)
+    interp_nn_detrended = interp_nn - np.mean(interp_nn)
+    freqs, psd = welch(interp_nn_detrended, fs=fs, nperseg=min(128, len(interp_nn_detrended)))
+    return band_powers(freqs, psd, lf_band, hf_band)
+
+
+def calculate_lf_hf_ratio_lomb(peak_time_points, ibi_values, lf_band, hf_band, resolution=0.005):
+    ''' LF and HF power of the unevenly sampled IBI series with a Lomb-Scargle periodogram, no resampling
+    '''
+    if len(ibi_values) < 4:
+        return 0, 0, 0
+    ibi_values = np.asarray(ibi_values, dtype=float)
+    freqs = np.arange(lf_band[0], hf_band[1] + resolution, resolution)
+    psd = lombscargle(np.asarray(peak_time_points, dtype=float), ibi_values - np.mean(ibi_values), 2 * np.pi * freqs)
+    return band_powers(freqs, psd, lf_band, hf_band)
+
+
+def band_powers(freqs, psd, lf_band, hf_band):
+    lf_mask = (freqs >= lf_band[0]) & (freqs <= lf_band[1])
+    hf_mask = (freqs >= hf_band[0]) & (freqs <= hf_band[1])
+    lf_power = trapezoid(psd[lf_mask], freqs[lf_mask])
+    hf_power = trapezoid(psd[hf_mask], freqs[hf_mask])
+    lf_hf_ratio = lf_power / hf_power if hf_power != 0 else 0
+    return lf_power, hf_power, lf_hf_ratio
+
+
+def hrv_score_from_rmssd(rmssd):
+    ''' ln(RMSSD in ms) scaled to 0-100
+    '''
+    epsilon = 1e-8
+    scaled_rmssd = rmssd * 1000
+    if scaled_rmssd <= 0:
+        return 0
+    ln_rmssd = np.log(scaled_rmssd + epsilon)
+    hrv_score = (ln_rmssd / 6.5) * 100
+    return max(0, min(hrv_score, 100))
+
+# -----------------------------------------------------------------------------------
+# INCREMENTAL HRV ENGINE
+# -----------------------------------------------------------------------------------
+class HRVEngine:
+    """ Heart rate and HRV metrics that are updated beat by beat.
+
+    Every confirmed beat is added exactly once with add_beat(). HR, RMSSD and SDNN are
+    kept as running sums over the last `window_duration` seconds, so reading them is O(1).
+    The LF/HF spectrum covers `frequency_analysis_buffer_duration` seconds of beats and is
+    only recomputed every `spectrum_hop` seconds.
+
+    Params:
+        window_duration (float) : Seconds of beats used for HR, RMSSD and SDNN
+        frequency_analysis_buffer_duration (float) : Seconds of beats used for LF/HF
+        lf_band, hf_band (tuple) : Frequency bands in Hz
+        spectrum_hop (float) : Seconds between two LF/HF updates
+        spectrum_method (str) : 'welch' (resampled to 4 Hz) or 'lomb' (Lomb-Scargle, no resampling)
+    """
+    def __init__(self, window_duration=10.0, frequency_analysis_buffer_duration=60.0, lf_band=(0.04, 0.15),
+                 hf_band=(0.15, 0.4), spectrum_hop=5.0, spectrum_method='welch'):
+        assert spectrum_method in ('welch', 'lomb'), "spectrum_method should be 'welch' or 'lomb'"
+        self.window_duration = window_duration
+        self.frequency_analysis_buffer_duration = frequency_analysis_buffer_duration
+        self.lf_band = lf_band
+        self.hf_band = hf_band
+        self.spectrum_hop = spectrum_hop
+        self.spectrum_method = spectrum_method
+
+        self.beat_count = 0
+        self._last_beat = None
+        # (beat number, beat time, IBI) in the short window and the running sums over it
+        self._window = deque()
+        self._ibi_sum = 0.0
+        self._ibi_square_sum = 0.0
+        self._hr_sum = 0.0
+        # (beat number, squared successive difference) for IBI pairs inside the short window
+        self._successive = deque()
+        self._successive_sum = 0.0
+        # (beat time, IBI) for the spectrum
+        self._spectrum_beats = deque()
+        self._spectrum_time = None
+        self.lf_power, self.hf_power, self.lf_hf_ratio = 0, 0, 0
+
+    def add_beat(self, beat_time, accepted=True):
+        ''' Add one R-peak time in seconds, beats have to arrive in order
+
+        A beat rejected by the signal-quality checks adds no IBI and breaks the chain, so neither
+        the IBI before nor the one after it enters the metrics.
+        '''
+        if not accepted:
+            self._last_beat = None
+            self.beat_count += 1
+            return
+        if self._last_beat is not None and beat_time > self._last_beat:
+            ibi = beat_time - self._last_beat
+            if self._window and self._window[-1][0] == self.beat_count - 1:
+                square_difference = (ibi - self._window[-1][2]) ** 2
+                self._successive.append((self.beat_count, square_difference))
+                self._successive_sum += square_difference
+            self._window.append((self.beat_count, beat_time, ibi))
+            self._ibi_sum += ibi
+            self._ibi_square_sum += ibi * ibi
+            self._hr_sum += 60 / ibi
+            self._spectrum_beats.append((beat_time, ibi))
+        self._last_beat = beat_time
+        self.beat_count += 1
+
+    def _evict(self, now):
+        cutoff = now - self.window_duration
+        while self._window and self._window[0][1] < cutoff:
+            number, _, ibi = self._window.popleft()
+            self._ibi_sum -= ibi
+            self._ibi_square_sum -= ibi * ibi
+            self._hr_sum -= 60 / ibi
+            # The successive difference ending at the next beat used this IBI
+            if self._successive and self._successive[0][0] <= number + 1:
+                self._successive_sum -= self._successive.popleft()[1]
+        if not self._window:
+            # Reset, so rounding errors of the running sums cannot accumulate
+            self._ibi_sum = self._ibi_square_sum = self._hr_sum = 0.0
+        if not self._successive:
+            self._successive_sum = 0.0
+
+        cutoff = now - self.frequency_analysis_buffer_duration
+        while self._spectrum_beats and self._spectrum_beats[0][0] < cutoff:
+            self._spectrum_beats.popleft()
+
+    @property
+    def heart_rate(self):
+        return self._hr_sum / len(self._window) if self._window else 0
+
+    @property
+    def rmssd(self):
+        return np.sqrt(max(self._successive_sum, 0.0) / len(self._successive)) if self._successive else 0
+
+    @property
+    def sdnn(self):
+        count = len(self._window)
+        if count < 2:
+            return 0
+        mean = self._ibi_sum / count
+        return np.sqrt(max(self._ibi_square_sum / count - mean * mean, 0.0))
+
+    def update_spectrum(self, now):
+        if self._spectrum_time is not None and now - self._spectrum_time < self.spectrum_hop:
+            return
+        self._spectrum_time = now
+        if len(self._spectrum_beats) < 4:
+            self.lf_power, self.hf_power, self.lf_hf_ratio = 0, 0, 0
+            return
+        beat_times, ibi_values = np.array(self._spectrum_beats).T
+        if self.spectrum_method == 'lomb':
+            spectrum = calculate_lf_hf_ratio_lomb(beat_times, ibi_values, self.lf_band, self.hf_band)
+        else:
+            spectrum = calculate_lf_hf_ratio_welch(beat_times, ibi_values, self.lf_band, self.hf_band)
+        self.lf_power, self.hf_power, self.lf_hf_ratio = spectrum
+
+    def skip(self, now):
+        ''' Only drop beats that left the windows, for ticks whose metrics are not computed
+        '''
+        self._evict(now)
+
+    def metrics(self, now):
+        ''' [heart rate, HRV score, LF/HF ratio] at time `now`, zeros while fewer than two IBIs are known
+        '''
+        self._evict(now)
+        if len(self._window) < 2:
+            return [0, 0, 0]
+        self.update_spectrum(now)
+        return [self.heart_rate, hrv_score_from_rmssd(self.rmssd), self.lf_hf_ratio]
@@ -0,0 +1,115 @@
+import asyncio
+import multiprocessing
+import sys
+
+from bleak import BleakScanner, BleakClient
+from bleak.exc import BleakError
+
+from acquire import ECG_SAMPLING_FREQ, StartStream, start_ecg, push_ecg_frame
+from config import load_config
+from processing import data_processing_main
+from sensor_clock import SensorClock
+
+# -----------------------------------------------------------------------------------
+# MULTI-DEVICE HUB
+# One process serves many Polar belts: every belt has its own BleakClient on the shared
+# event loop, its own ECG outlet and its own processing worker process.
+# -----------------------------------------------------------------------------------
+class PolarDevice:
+    """ One Polar belt streaming ECG to its own LSL outlet, reconnecting when the link drops.
+
+    Streams are named after the last four hex digits of the address, e.g. PolarBand_51BE,
+    EMG_activity_51BE and HRV_HR_Measures_51BE.
+
+    Params:
+        address (str) : Bluetooth address of the belt
+        stream_name (str) : Name of the ECG outlet before the address suffix
+        min_backoff (float) : Seconds to wait before the first reconnect attempt
+        max_backoff (float) : Upper limit of the doubling reconnect delay
+    """
+    def __init__(self, address, stream_name="PolarBand", min_backoff=1.0, max_backoff=30.0):
+        self.address = address
+        self.suffix = "_" + address.replace(":", "")[-4:].upper()
+        self.source_id = "polar_" + address.replace(":", "").lower()
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.outlet = StartStream(stream_name + self.suffix, self.source_id)
+        self.sensor_clock = SensorClock(ECG_SAMPLING_FREQ)
+        self.reconnects = 0
+        self._disconnected = None
+
+    def on_data(self, sender, data: bytearray):
+        push_ecg_frame(self.outlet, self.sensor_clock, data)
+
+    def on_disconnect(self, client):
+        print(f"[{self.address}] Disconnected.", flush=True)
+        self._disconnected.set()
+
+    async def run(self):
+        ''' Keep the belt connected until the task is cancelled
+        '''
+        backoff = self.min_backoff
+        while True:
+            self._disconnected = asyncio.Event()
+            try:
+                print(f"[{self.address}] Connecting...", flush=True)
+                async with BleakClient(self.address, disconnected_callback=self.on_disconnect) as client:
+                    await start_ecg(client, self.on_data)
+                    backoff = self.min_backoff
+                    await self._disconnected.wait()
+            except (BleakError, asyncio.TimeoutError, OSError) as error:
+                print(f"[{self.address}] Connection failed: {error}", flush=True)
+            self.reconnects += 1
+            print(f"[{self.address}] Reconnecting in {backoff:.0f} s "
+                  f"({self.sensor_clock.lost_samples} samples lost so far).", flush=True)
+            await asyncio.sleep(backoff)
+            backoff = min(2 * backoff, self.max_backoff)
+
+
+async def discover_addresses(timeout=5.0):
+    ''' Addresses of all Polar devices in range
+    '''
+    print("Scanning for Polar devices...")
+    devices = await BleakScanner.discover(timeout=timeout)
+    return [d.address for d in devices if d.name and "Polar" in d.name]
+
+
+def start_worker(device, headless=True, config=None):
+    ''' Run the processing pipeline of one device in its own process, so numpy/scipy work is spread over cores
+    '''
+    worker = multiprocessing.get_context("spawn").Process(
+        target=data_processing_main,
+        args=(headless, device.source_id, device.suffix, None, config),
+        name="processing" + device.suffix,
+        daemon=True
+    )
+    worker.start()
+    return worker
+
+
+async def run_hub(addresses=None, headless=True, config=None):
+    if config is None:
+        config = load_config()
+    if not addresses:
+        addresses = await discover_addresses()
+    if not addresses:
+        print("No Polar device found. Exiting.")
+        sys.exit(1)
+    print(f"Serving {len(addresses)} device(s): {', '.join(addresses)}", flush=True)
+
+    devices = [PolarDevice(address, config["device"]["stream_name"]) for address in addresses]
+    workers = [start_worker(device, headless, config) for device in devices]
+    try:
+        await asyncio.gather(*(device.run() for device in devices))
+    finally:
+        for worker in workers:
+            worker.terminate()
+
+
+# -----------------------------------------------------------------------------------
+# ENTRY POINT
+# Same as `python cli.py hub`, the arguments are defined in cli.py.
+# -----------------------------------------------------------------------------------
+if __name__ == "__main__":
+    from cli import main as cli_main
+    sys.exit(cli_main(["hub"] + sys.argv[1:]))
@@ -0,0 +1,288 @@
+import json
+import threading
+import time
+from itertools import accumulate
+
+# -----------------------------------------------------------------------------------
+# INSTRUMENTATION
+# Stage timings, latencies, counters and gauges of the running pipeline.
+# Everything goes through the INSTRUMENTS singleton. While it is disabled, span() hands
+# out one shared no-op context and the other calls return after a single flag check.
+# -----------------------------------------------------------------------------------
+class Histogram:
+    """ Log-linear histogram of durations in the style of HdrHistogram.
+
+    Values are kept in microseconds with 7 significant bits, so every recorded value is
+    exact to within 1.6 % from 1 us up to hours, in a fixed list of counters.
+    """
+    SUB_BITS = 7
+    SUB_COUNT = 1 << SUB_BITS
+    HALF_COUNT = SUB_COUNT >> 1
+    SIZE = SUB_COUNT + 40 * HALF_COUNT
+
+    def __init__(self):
+        self.counts = [0] * self.SIZE
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = 0
+
+    @classmethod
+    def index(cls, value):
+        if value < cls.SUB_COUNT:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS
+        return min(cls.SUB_COUNT + (shift - 1) * cls.HALF_COUNT + (value >> shift) - cls.HALF_COUNT, cls.SIZE - 1)
+
+    @classmethod
+    def value_at(cls, index):
+        ''' Lower bound of a bucket in microseconds
+        '''
+        if index < cls.SUB_COUNT:
+            return index
+        shift, sub = divmod(index - cls.SUB_COUNT, cls.HALF_COUNT)
+        return (sub + cls.HALF_COUNT) << (shift + 1)
+
+    def record(self, seconds):
+        value = max(int(seconds * 1e6), 0)
+        self.counts[self.index(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q):
+        ''' Value in seconds below which `q` percent of the recorded values fall
+        '''
+        if self.count == 0:
+            return 0.0
+        rank = max(q / 100 * self.count, 1)
+        for index, cumulative in enumerate(accumulate(self.counts)):
+            if cumulative >= rank:
+                return min(self.value_at(index), self.max) / 1e6
+        return self.max / 1e6
+
+    def summary(self):
+        return dict(count=self.count, mean=self.total / self.count / 1e6 if self.count else 0.0,
+                    min=(self.min or 0) / 1e6, p50=self.percentile(50), p90=self.percentile(90),
+                    p99=self.percentile(99), max=self.max / 1e6)
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """ Times a block with the monotonic perf_counter and records it into a histogram
+    """
+    __slots__ = ("instruments", "name", "start")
+
+    def __init__(self, instruments, name):
+        self.instruments = instruments
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.instruments.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Instrumentation:
+    """ Registry of histograms (stage timings and latencies in seconds), counters and gauges.
+
+    Usage:
+        with INSTRUMENTS.span("detect"):
+            ...
+        INSTRUMENTS.count("samples_in", len(timestamps))
+        INSTRUMENTS.gauge("inlet_backlog", inlet.samples_available())
+    """
+    def __init__(self):
+        self.enabled = False
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.enabled = True
+
+    def span(self, name):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        if self.enabled:
+            self.gauges[name] = value
+
+    def snapshot(self):
+        ''' Summaries of all histograms plus the counter totals and the latest gauge values
+        '''
+        with self._lock:
+            return dict(
+                time=time.time(),
+                histograms={name: histogram.summary() for name, histogram in self.histograms.items()},
+                counters=dict(self.counters),
+                gauges=dict(self.gauges)
+            )
+
+    def drain(self):
+        ''' Hand over everything recorded so far and start from zero, for merging in another process
+        '''
+        with self._lock:
+            state = (self.histograms, self.counters, dict(self.gauges))
+            self.histograms, self.counters = {}, {}
+        return state
+
+    def merge(self, state):
+        histograms, counters, gauges = state
+        with self._lock:
+            for name, histogram in histograms.items():
+                if name in self.histograms:
+                    self.histograms[name].merge(histogram)
+                else:
+                    self.histograms[name] = histogram
+            for name, value in counters.items():
+                self.counters[name] = self.counters.get(name, 0) + value
+            self.gauges.update(gauges)
+
+
+INSTRUMENTS = Instrumentation()
+
+# -----------------------------------------------------------------------------------
+# EXPORTERS
+# -----------------------------------------------------------------------------------
+class DiagnosticsOutlet:
+    """ Publishes a JSON snapshot on an irregular-rate LSL string stream every `interval` seconds.
+
+    Counters are sent as totals and as rates per second since the previous snapshot.
+
+    Params:
+        name (str) : Stream name, the type is 'Diagnostics'
+        interval (float) : Seconds between snapshots
+    """
+    def __init__(self, name="PolarDiagnostics", interval=1.0, source_id="polar_diagnostics", instruments=None):
+        from pylsl import IRREGULAR_RATE, StreamInfo, StreamOutlet
+        self.instruments = instruments or INSTRUMENTS
+        self.interval = interval
+        info = StreamInfo(name, 'Diagnostics', 1, IRREGULAR_RATE, 'string', source_id)
+        self.outlet = StreamOutlet(info)
+        self._previous = None
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            self.outlet.push_sample([json.dumps(self.sample())])
+
+    def sample(self):
+        snapshot = self.instruments.snapshot()
+        if self._previous is not None:
+            elapsed = snapshot["time"] - self._previous["time"]
+            snapshot["rates"] = {
+                name: (value - self._previous["counters"].get(name, 0)) / elapsed
+                for name, value in snapshot["counters"].items()
+            }
+        self._previous = snapshot
+        return snapshot
+
+
+class PrometheusServer:
+    """ Serves the instrumentation in the Prometheus text format on http://host:port/metrics.
+
+    Histograms become summaries (quantiles in seconds), counters `_total` series and gauges plain values.
+    """
+    def __init__(self, port=9108, host="127.0.0.1", prefix="polar_", instruments=None):
+        # Imported here, processes without a metrics port never pay for http.server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        instruments = instruments or INSTRUMENTS
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = prometheus_text(instruments.snapshot(), prefix).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    def start(self):
+        thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+
+def prometheus_text(snapshot, prefix="polar_"):
+    lines = []
+    for name, summary in sorted(snapshot["histograms"].items()):
+        metric = prefix + name + "_seconds"
+        lines.append(f"# TYPE {metric} summary")
+        for quantile in ("50", "90", "99"):
+            lines.append(f'{metric}{{quantile="0.{quantile}"}} {summary["p" + quantile]:.6f}')
+        lines.append(f"{metric}_sum {summary['mean'] * summary['count']:.6f}")
+        lines.append(f"{metric}_count {summary['count']}")
+    for name, value in sorted(snapshot["counters"].items()):
+        lines.append(f"# TYPE {prefix}{name}_total counter")
+        lines.append(f"{prefix}{name}_total {value}")
+    for name, value in sorted(snapshot["gauges"].items()):
+        lines.append(f"# TYPE {prefix}{name} gauge")
+        lines.append(f"{prefix}{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def start_instrumentation(diagnostics=False, metrics_port=None):
+    ''' Turn on the stage timings and publish them as an LSL stream and/or a Prometheus endpoint
+    '''
+    INSTRUMENTS.enable()
+    if diagnostics:
+        DiagnosticsOutlet().start()
+        print("Publishing diagnostics on the LSL stream PolarDiagnostics.")
+    if metrics_port:
+        PrometheusServer(metrics_port).start()
+        print(f"Serving metrics on http://127.0.0.1:{metrics_port}/metrics")
@@ -1,5 +1,9 @@
 import numpy as np
-from scipy.signal import butter, filtfilt, iirnotch
+from collections import deque
+from scipy.ndimage import maximum_filter1d
+from scipy.signal import sosfiltfilt
+
+from filters import MovingSum, SOSFilter, design_sos, sos_group_delay
 
 class Pan_tompkins:
     """ Implementation of Pan Tompkins Algorithm.
@@ -7,22 +11,30 @@ class Pan_tompkins:
     Noise cancellation (bandpass filter) -> Derivative step -> Squaring and integration.
 
     Params:
-        data (array) : ECG data
+        data (array) : ECG data, one channel or (channels, samples)
         sampling rate (int)
     returns:
         Integrated signal (array) : This signal can be used to detect peaks
 
+    Streaming mode:
+        Call start_stream() once and then update() with every new chunk of samples.
+        Filter state and the integration window are kept between calls and only
+        newly confirmed R-peaks (absolute sample indices) are returned.
+        Several channels are filtered together as one (channels, samples) array,
+        only the decision stage runs per channel.
+
     """
-    def __init__(self, data, sample_rate):
-        self.data = data
+    def __init__(self, data=None, sample_rate=None):
+        self.data = None if data is None else np.asarray(data)
         self.sample_rate = sample_rate
 
-    def fit(self, normalized_cut_offs=None, butter_filter_order=2, padlen=150, window_size=None):
+    def fit(self, normalized_cut_offs=None, butter_filter_order=2, padlen=150, window_size=None,
+            notch_freq=50.0, quality_factor=30.0):
         ''' Fit the signal according to algorithm and returns integrated signal
         '''
         # 1. Noise cancellation using bandpass filter and notch filter
         self.filtered_BandPass = self.band_pass_filter(normalized_cut_offs, butter_filter_order, padlen)
-        self.filtered_Notch = self.notch_filter(self.filtered_BandPass)
+        self.filtered_Notch = self.notch_filter(self.filtered_BandPass, notch_freq, quality_factor)
 
         # 2. Derivative filter to get slope of the QRS
         self.derviate_pass = self.derivative_filter()
@@ -36,49 +48,50 @@ class Pan_tompkins:
         return self.integrated_signal
 
     def band_pass_filter(self, normalized_cut_offs=None, butter_filter_order=2, padlen=150):
-        ''' Band pass filter for Pan Tompkins algorithm with a bandpass setting of 5 to 20 Hz
+        ''' Band pass filter for Pan Tompkins algorithm with a bandpass setting of 5 to 15 Hz
         '''
-        # Calculate Nyquist sample rate and cutoffs
-        nyquist_sample_rate = self.sample_rate / 2
-
-        # Calculate cutoffs
-        if normalized_cut_offs is None:
-            normalized_cut_offs = [5/nyquist_sample_rate, 15/nyquist_sample_rate]
-        else:
-            assert type(self.sample_rate) is list, "Cutoffs should be a list with [low, high] values"
-
-        # Butter coefficients 
-        b_coeff, a_coeff = butter(butter_filter_order, normalized_cut_offs, btype='bandpass')[:2]
+        # Cached second-order sections of the Butterworth bandpass
+        sos = design_sos('bandpass', self.band(normalized_cut_offs), self.sample_rate, butter_filter_order)
 
-        if len(self.data) <= padlen:
-            padlen = len(self.data) - 1
+        if self.data.shape[-1] <= padlen:
+            padlen = self.data.shape[-1] - 1
 
         # Apply forward and backward filter
-        filtered_BandPass = filtfilt(b_coeff, a_coeff, self.data, padlen=padlen)
+        filtered_BandPass = sosfiltfilt(sos, self.data, padlen=padlen, axis=-1)
         
         return filtered_BandPass
 
     def notch_filter(self, data, notch_freq=50.0, quality_factor=30.0):
         ''' Notch filter to remove powerline interference (50 Hz or 60 Hz)
         '''
-        nyquist_freq = 0.5 * self.sample_rate
-        norm_notch_freq = notch_freq / nyquist_freq
-        b, a = iirnotch(norm_notch_freq, quality_factor)
-        filtered_Notch = filtfilt(b, a, data)
+        sos = design_sos('notch', (notch_freq,), self.sample_rate, quality_factor=quality_factor)
+        filtered_Notch = sosfiltfilt(sos, data, axis=-1)
         return filtered_Notch
 
+    def band(self, normalized_cut_offs=None):
+        ''' Bandpass edges in Hz, 5 to 15 Hz unless [low, high] cutoffs relative to Nyquist are given
+        '''
+        assert self.sample_rate is not None, "Filtering needs a sampling rate"
+        if normalized_cut_offs is None:
+            return (5.0, 15.0)
+        assert len(normalized_cut_offs) == 2 and 0 < normalized_cut_offs[0] < normalized_cut_offs[1] < 1, \
+            "Cutoffs should be a list with [low, high] values relative to Nyquist"
+        # Rounded so equal bands given in different ways share one cached design
+        nyquist_sample_rate = self.sample_rate / 2
+        return tuple(round(cut_off * nyquist_sample_rate, 9) for cut_off in normalized_cut_offs)
+
     def derivative_filter(self):
         ''' Derivative filter
         '''
         # Apply differentiation
-        derviate_pass = np.diff(self.filtered_Notch)
+        derviate_pass = np.diff(self.filtered_Notch, axis=-1)
         return derviate_pass
 
     def squaring(self):
         ''' Squaring application on derivative filter output data
         '''
         # Apply squaring
-        square_pass = self.derivative_filter() ** 2
+        square_pass = self.derviate_pass ** 2
         return square_pass 
 
     def moving_window_integration(self, window_size=None):
@@ -89,14 +102,14 @@ class Pan_tompkins:
             window_size = int(0.08 * int(self.sample_rate))  # given in paper 150ms as a window size
         
         # Define integrated signal
-        integrated_signal = np.zeros_like(self.squaring())
+        integrated_signal = np.zeros_like(self.square_pass)
 
         # Cumulative sum of signal
-        cumulative_sum = self.squaring().cumsum()
+        cumulative_sum = self.square_pass.cumsum(axis=-1)
 
         # Estimation of area/ integral below the curve defines the data
-        integrated_signal[window_size:] = (cumulative_sum[window_size:] - cumulative_sum[:-window_size]) / window_size
-        integrated_signal[:window_size] = cumulative_sum[:window_size] / np.arange(1, window_size + 1)
+        integrated_signal[..., window_size:] = (cumulative_sum[..., window_size:] - cumulative_sum[..., :-window_size]) / window_size
+        integrated_signal[..., :window_size] = cumulative_sum[..., :window_size] / np.arange(1, window_size + 1)
 
         return integrated_signal
 
@@ -111,21 +124,303 @@ class Pan_tompkins:
         Returns:
             array: Indices of peaks in the signal.
         """
-        len_data = data.size
-        x = np.zeros(len_data + 2 * spacing)
-        x[:spacing] = data[0] - 1.e-6
-        x[-spacing:] = data[-1] - 1.e-6
-        x[spacing:spacing + len_data] = data
-        peak_candidate = np.ones(len_data, dtype=bool)
-        for s in range(1, spacing + 1):
-            start = spacing - s
-            h_b = x[start: start + len_data]  # before
-            start = spacing
-            h_c = x[start: start + len_data]  # central
-            start = spacing + s
-            h_a = x[start: start + len_data]  # after
-            peak_candidate = peak_candidate & (h_c > h_b) & (h_c > h_a)  # keep points that are > than their neighbours
-        ind = np.argwhere(peak_candidate).flatten()  # find indices of peak candidates
+        ind = np.flatnonzero(self._peak_mask(data, spacing))  # find indices of peak candidates
         if limit is not None:
             ind = ind[data[ind] > limit]  # filter out peaks below the limit
-        return ind
\ No newline at end of file
+        return ind
+
+    @staticmethod
+    def _peak_mask(data, spacing):
+        ''' True where a sample is larger than the `spacing` samples on both sides, along the last axis
+        '''
+        len_data = data.shape[-1]
+        x = np.zeros(data.shape[:-1] + (len_data + 2 * spacing,))
+        x[..., :spacing] = data[..., :1] - 1.e-6
+        x[..., -spacing:] = data[..., -1:] - 1.e-6
+        x[..., spacing:spacing + len_data] = data
+
+        # Sliding maximum over the previous `spacing` samples, computed in a single pass
+        trailing_max = maximum_filter1d(x, spacing, axis=-1, origin=(spacing - 1) // 2, mode='nearest')
+        before = trailing_max[..., spacing - 1: spacing - 1 + len_data]  # max of the samples before
+        after = trailing_max[..., 2 * spacing: 2 * spacing + len_data]  # max of the samples after
+        return (data > before) & (data > after)  # keep points that are > than their neighbours
+
+    def detect_peaks(self, data=None, spacing=None, learning_duration=2.0, refractory_period=0.2):
+        """Detect QRS complexes in an integrated signal with the adaptive threshold decision stage.
+
+        Params:
+            data (array): Integrated signal, defaults to the result of fit().
+            spacing (int): Minimum number of samples between successive peak candidates.
+            learning_duration (float): Seconds at the start used to initialise the thresholds.
+            refractory_period (float): Seconds after an R-peak in which no other R-peak is accepted.
+
+        Returns:
+            array: Indices of detected QRS complexes in the integrated signal, a list of arrays for
+            (channels, samples) data.
+        """
+        if data is None:
+            data = self.integrated_signal
+        if data.ndim == 2:
+            return [self.detect_peaks(channel, spacing, learning_duration, refractory_period) for channel in data]
+        if spacing is None:
+            spacing = int(self.sample_rate) // 10
+        decision = AdaptiveThreshold(self.sample_rate, refractory_period=refractory_period)
+        decision.learn(data[:max(int(learning_duration * self.sample_rate), 1)])
+        candidates = self.findpeaks(data, spacing=spacing)
+        return decision.update(candidates, data[candidates], data.size)
+
+    # -----------------------------------------------------------------------------------
+    # STREAMING MODE
+    # -----------------------------------------------------------------------------------
+    def start_stream(self, normalized_cut_offs=None, butter_filter_order=2, window_size=None,
+                     notch_freq=50.0, quality_factor=30.0, spacing=None, learning_duration=2.0,
+                     history_duration=4.0, refractory_period=0.2, channel_count=1):
+        ''' Prepare causal filter state for incremental processing with update()
+
+        Params:
+            normalized_cut_offs (list): [low, high] bandpass cutoffs relative to Nyquist.
+            butter_filter_order (int): Order of the Butterworth bandpass.
+            window_size (int): Moving window integration length in samples.
+            notch_freq (float): Powerline frequency to remove (50 Hz or 60 Hz).
+            quality_factor (float): Quality factor of the notch filter.
+            spacing (int): Minimum number of samples between successive peak candidates.
+            learning_duration (float): Seconds of signal used to initialise the adaptive thresholds.
+            history_duration (float): Seconds of filtered/integrated signal kept for peak search and search-back.
+            refractory_period (float): Seconds after an R-peak in which no other R-peak is accepted.
+            channel_count (int): Number of channels passed to update().
+        '''
+        assert self.sample_rate is not None, "Streaming mode needs a sampling rate"
+        band = self.band(normalized_cut_offs)
+        if window_size is None:
+            window_size = int(0.08 * int(self.sample_rate))
+        if spacing is None:
+            spacing = int(self.sample_rate) // 10
+
+        # Causal filters in second-order sections, state is carried between chunks
+        self.channel_count = channel_count
+        self._band_filter = SOSFilter(design_sos('bandpass', band, self.sample_rate, butter_filter_order),
+                                      channel_count)
+        self._notch_filter = SOSFilter(design_sos('notch', (notch_freq,), self.sample_rate,
+                                                  quality_factor=quality_factor), channel_count, steady_state=False)
+
+        # Causal filtering shifts the QRS complex, compensate with the group delay at the band centre
+        centre_freq = np.sqrt(band[0] * band[1])
+        delay = sum(sos_group_delay(stage.sos, centre_freq, self.sample_rate)
+                    for stage in (self._band_filter, self._notch_filter))
+        self.filter_delay = int(round(delay))
+
+        self.window_size = window_size
+        self.spacing = spacing
+        self._learning_size = max(int(learning_duration * self.sample_rate), 2 * (window_size + spacing))
+        self._history_size = max(int(history_duration * self.sample_rate), self._learning_size)
+        self.decisions = [AdaptiveThreshold(self.sample_rate, refractory_period=refractory_period)
+                          for _ in range(channel_count)]
+        self._last_filtered = None
+        self._moving_sum = MovingSum(window_size, channel_count)
+        self._filtered_history = np.empty((channel_count, 0))
+        self._integrated_history = np.empty((channel_count, 0))
+        self._history_start = 0
+        self._sample_count = 0
+        self._next_candidate = 0
+
+    def update(self, chunk):
+        ''' Push a chunk of new samples and return newly confirmed R-peaks
+
+        Params:
+            chunk (array): New ECG samples, in order of arrival. One channel or (channels, samples).
+
+        Returns:
+            array: Absolute sample indices (counted from the first streamed sample) of new R-peaks,
+            a list with one array per channel for (channels, samples) chunks.
+        '''
+        chunk = np.asarray(chunk, dtype=float)
+        single_channel = chunk.ndim == 1
+        if single_channel and self.channel_count != 1:
+            raise ValueError(f"A one channel chunk was passed to a detector of {self.channel_count} channels")
+        if chunk.ndim == 2 and chunk.shape[0] != self.channel_count:
+            raise ValueError(f"Chunk of shape {chunk.shape} should be ({self.channel_count}, samples)")
+        if chunk.ndim > 2:
+            raise ValueError(f"Chunk of shape {chunk.shape} should be (channels, samples)")
+        chunk = chunk.reshape(self.channel_count, -1)
+        if chunk.shape[1] == 0:
+            new_peaks = [np.empty(0, dtype=np.int64)] * self.channel_count
+            return new_peaks[0] if single_channel else new_peaks
+
+        # 1. Causal bandpass and notch filter
+        filtered = self._notch_filter(self._band_filter(chunk))
+
+        # 2. Derivative, continued from the last sample of the previous chunk
+        if self._last_filtered is None:
+            self._last_filtered = filtered[:, :1]
+        derviate_pass = np.diff(filtered, axis=-1, prepend=self._last_filtered)
+        self._last_filtered = filtered[:, -1:]
+
+        # 3. Squaring and 4. moving window integration
+        integrated = self._integrate_stream(derviate_pass ** 2)
+
+        self._append_history(filtered, integrated)
+        new_peaks = self._detect_stream()
+        return new_peaks[0] if single_channel else new_peaks
+
+    def _integrate_stream(self, square_pass):
+        ''' Moving window integration continued over the tail of the previous chunk
+        '''
+        count = square_pass.shape[1]
+        window_sum = self._moving_sum(square_pass)
+
+        # Until the window is filled, average over the samples seen so far like fit() does
+        seen = np.arange(self._sample_count + 1, self._sample_count + count + 1)
+        return window_sum / np.minimum(seen, self.window_size)
+
+    def recent_filtered(self, count):
+        ''' Last `count` samples (at most history_duration seconds) of the bandpass and notch filtered signal,
+        shape (channels, samples)
+        '''
+        return self._filtered_history[:, -count:]
+
+    def _append_history(self, filtered, integrated):
+        ''' Keep the last history_duration seconds of filtered and integrated signal
+        '''
+        self._sample_count += filtered.shape[1]
+        self._filtered_history = np.concatenate((self._filtered_history, filtered), axis=1)[:, -self._history_size:]
+        self._integrated_history = np.concatenate((self._integrated_history, integrated), axis=1)[:, -self._history_size:]
+        self._history_start = self._sample_count - self._integrated_history.shape[1]
+
+    def _detect_stream(self):
+        ''' Find peak candidates that can no longer be beaten by a later sample and classify them
+
+        A candidate is confirmed once `spacing` samples after it have been integrated.
+        Nothing is reported before the first learning_duration seconds have been seen.
+        '''
+        confirmed_end = self._sample_count - self.spacing
+        if self._sample_count < self._learning_size or confirmed_end <= self._next_candidate:
+            return [np.empty(0, dtype=np.int64)] * self.channel_count
+
+        # Candidates of all channels in one pass, then the decision stage of every channel
+        context_start = max(self._next_candidate - self.spacing, self._history_start)
+        segment = self._integrated_history[:, context_start - self._history_start:]
+        peak_mask = self._peak_mask(segment, self.spacing)
+        peak_mask[:, :self._next_candidate - context_start] = False
+        peak_mask[:, confirmed_end - context_start:] = False
+        self._next_candidate = confirmed_end
+
+        new_peaks = []
+        for channel, decision in enumerate(self.decisions):
+            if not decision.initialised:
+                decision.learn(self._integrated_history[channel])
+            candidates = np.flatnonzero(peak_mask[channel]) + context_start
+            heights = self._integrated_history[channel, candidates - self._history_start]
+            new_peaks.append(self._locate_r_peaks(channel, decision.update(candidates, heights, confirmed_end)))
+        return new_peaks
+
+    def _locate_r_peaks(self, channel, candidates):
+        ''' Map integrated-signal peaks back to the R-peak position in the raw signal
+        '''
+        if candidates.size == 0:
+            return np.empty(0, dtype=np.int64)
+        # Largest |filtered| sample in the integration window that ends at each candidate
+        ends = np.maximum(candidates - self._history_start + 1, 1)
+        starts = np.maximum(ends - self.window_size - 1, 0)
+        windows = np.minimum(starts[:, np.newaxis] + np.arange(self.window_size + 1), ends[:, np.newaxis] - 1)
+        r_peaks = starts + np.argmax(np.abs(self._filtered_history[channel, windows]), axis=1) + self._history_start
+        return np.maximum(r_peaks - self.filter_delay, 0)
+
+
+class AdaptiveThreshold:
+    """ Pan Tompkins decision stage for peaks of the integrated signal.
+
+    Keeps running estimates of the signal peak (SPKI) and noise peak (NPKI) levels, classifies
+    candidates against THRESHOLD_I1 = NPKI + 0.25 * (SPKI - NPKI), enforces a refractory period and
+    searches back with THRESHOLD_I2 = 0.5 * THRESHOLD_I1 when no beat was found within 166 % of the
+    average RR interval. The state is kept between calls, so candidates can be fed chunk by chunk.
+
+    Params:
+        sample_rate (int)
+        refractory_period (float) : Seconds after an R-peak in which no other R-peak is accepted
+    """
+    def __init__(self, sample_rate, refractory_period=0.2):
+        self.sample_rate = sample_rate
+        self.refractory = int(refractory_period * sample_rate)
+        self.initialised = False
+        self.signal_level = 0.0
+        self.noise_level = 0.0
+        self.last_qrs = None
+        self._rr_recent = deque(maxlen=8)
+        self._rr_regular = deque(maxlen=8)
+        self._noise_peaks = []  # (index, height) of noise peaks since the last QRS, for search-back
+
+    @property
+    def threshold(self):
+        return self.noise_level + 0.25 * (self.signal_level - self.noise_level)
+
+    def learn(self, data):
+        ''' Initialise signal and noise levels from a learning window of the integrated signal
+        '''
+        self.signal_level = 0.25 * np.max(data)
+        self.noise_level = 0.5 * np.mean(data)
+        self.initialised = True
+
+    def update(self, candidates, heights, end=None):
+        ''' Classify peak candidates (in order of time) and return the indices accepted as QRS
+
+        Params:
+            candidates (array): Sample indices of local maxima of the integrated signal.
+            heights (array): Integrated signal values at the candidates.
+            end (int): Index up to which the signal has been examined, used for search-back.
+
+        Returns:
+            array: Indices of accepted QRS complexes, including peaks recovered by search-back.
+        '''
+        if not self.initialised:
+            self.learn(heights if len(heights) else np.zeros(1))
+
+        accepted = []
+        for index, height in zip(candidates, heights):
+            self._search_back(index, accepted)
+            if self.last_qrs is not None and index - self.last_qrs < self.refractory:
+                self.noise_level = 0.125 * height + 0.875 * self.noise_level
+            elif height > self.threshold:
+                self.signal_level = 0.125 * height + 0.875 * self.signal_level
+                self._accept(index, accepted)
+            else:
+                self.noise_level = 0.125 * height + 0.875 * self.noise_level
+                self._noise_peaks.append((index, height))
+        if end is not None:
+            self._search_back(end, accepted)
+        return np.array(accepted, dtype=np.int64)
+
+    def _accept(self, index, accepted):
+        if self.last_qrs is not None:
+            self._add_rr(index - self.last_qrs)
+        self.last_qrs = index
+        self._noise_peaks = []
+        accepted.append(index)
+
+    def _add_rr(self, rr):
+        ''' Track the last 8 RR intervals and the last 8 that were within 92-116 % of the regular average
+        '''
+        self._rr_recent.append(rr)
+        if not self._rr_regular:
+            self._rr_regular.append(rr)
+            return
+        average = np.mean(self._rr_regular)
+        if 0.92 * average < rr < 1.16 * average:
+            self._rr_regular.append(rr)
+        elif len(self._rr_recent) == self._rr_recent.maxlen and all(
+                not 0.92 * average < r < 1.16 * average for r in self._rr_recent):
+            # The rhythm changed, start over from the recent intervals
+            self._rr_regular = deque(self._rr_recent, maxlen=self._rr_regular.maxlen)
+
+    def _search_back(self, now, accepted):
+        ''' Recover the largest noise peak above THRESHOLD_I2 when a beat seems to be missing
+        '''
+        if self.last_qrs is None or not self._rr_regular or not self._noise_peaks:
+            return
+        if now - self.last_qrs <= 1.66 * np.mean(self._rr_regular):
+            return
+        index, height = max(self._noise_peaks, key=lambda peak: peak[1])
+        if height > 0.5 * self.threshold and index - self.last_qrs >= self.refractory:
+            self.signal_level = 0.25 * height + 0.75 * self.signal_level
+            self._accept(index, accepted)
+        else:
+            self._noise_peaks = []
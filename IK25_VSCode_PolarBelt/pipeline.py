@@ -0,0 +1,254 @@
+import numpy as np
+from collections import deque
+
+from emg import EMGEnvelope
+from hrv import HRVEngine
+from instrumentation import INSTRUMENTS
+from pan_tompkins import Pan_tompkins
+from qrs import QRSBlanker
+from quality import SignalQuality
+from ring_buffer import RingBuffer
+
+# -----------------------------------------------------------------------------------
+# PROCESSING PIPELINE
+# ingest -> detect -> metrics -> EMG -> publish (publisher.py) -> render
+# Every stage runs once per tick, its results are kept in a Tick and reused downstream.
+# -----------------------------------------------------------------------------------
+class Tick:
+    """ Results of one processing tick.
+
+    Params:
+        timestamps (array) : Timestamps of the buffered window
+        signals (array) : Raw selected channels, shape (channels, samples)
+        peak_indices (list) : R-peak indices into the window, one array per channel
+        metrics (list) : [heart rate, HRV score, LF/HF ratio, signal quality] per channel
+        envelopes (array) : EMG envelope, shape (channels, samples)
+        envelope_timestamps (array) : Sample timestamps of the envelope, it lags behind the raw window
+        new_sample_count (int) : Number of envelope samples at the end not yet published
+        beats (array) : Beats confirmed since the last tick, rows of [time, IBI, amplitude, quality, channel]
+    """
+    def __init__(self, timestamps, signals, peak_indices, metrics, envelopes, envelope_timestamps, new_sample_count,
+                 beats):
+        self.timestamps = timestamps
+        self.signals = signals
+        self.peak_indices = peak_indices
+        self.metrics = metrics
+        self.envelopes = envelopes
+        self.envelope_timestamps = envelope_timestamps
+        self.new_sample_count = new_sample_count
+        self.beats = beats
+
+
+class ProcessingPipeline:
+    """ ECG processing for one LSL stream: R-peaks, HR/HRV metrics and an EMG envelope.
+
+    Params:
+        sample_rate (int)
+        channel_count (int) : Channels of the incoming stream
+        selected_channels (list) : Channels that carry ECG
+        qrs_removal (str) : 'interpolate' or 'template', how QRS complexes are removed before the EMG stage
+        ecg_band (tuple) : Pan-Tompkins bandpass edges in Hz
+        notch_freq (float) : Powerline frequency removed from the ECG (50 Hz or 60 Hz)
+        filter_order (int) : Butterworth order of the ECG and EMG bandpass filters
+        emg_band (tuple) : EMG bandpass edges in Hz, the upper edge is kept below Nyquist
+        min_quality (float) : Signal-quality index below which a channel publishes zeros instead of metrics
+            and EMG envelope
+    """
+    def __init__(self, sample_rate, channel_count, selected_channels=(0,), plot_length=10,
+                 EMG_average_window_duration=1.0, lf_band=(0.04, 0.15), hf_band=(0.15, 0.4),
+                 frequency_analysis_buffer_duration=60, spectrum_hop=5.0, spectrum_method='welch',
+                 qrs_removal='interpolate', ecg_band=(5.0, 15.0), notch_freq=50.0, filter_order=2,
+                 emg_band=(40.0, 450.0), min_quality=0.5):
+        self.sample_rate = sample_rate
+        self.selected_channels = list(selected_channels)
+        self.buffer_size = int(sample_rate * plot_length)
+        self.sample_store = RingBuffer(channel_count, self.buffer_size)
+        self.last_sent_index = 0
+
+        # Every beat enters the HRV engine of its channel exactly once
+        self.hrv = [
+            HRVEngine(plot_length, frequency_analysis_buffer_duration, lf_band, hf_band, spectrum_hop, spectrum_method)
+            for _ in self.selected_channels
+        ]
+
+        # One streaming Pan-Tompkins detector filters all channels together and keeps its state between chunks
+        self.peak_detector = Pan_tompkins(sample_rate=sample_rate)
+        nyquist = sample_rate / 2
+        self.peak_detector.start_stream(normalized_cut_offs=[ecg_band[0] / nyquist, ecg_band[1] / nyquist],
+                                        butter_filter_order=filter_order, notch_freq=notch_freq,
+                                        channel_count=len(self.selected_channels))
+        self.detected_peaks = [deque() for _ in self.selected_channels]
+
+        # Beats that fail the quality checks stay out of the HRV engine, bad windows skip the metrics
+        self.quality = SignalQuality(sample_rate, len(self.selected_channels))
+        self.min_quality = min_quality
+        self.last_beat_times = [None] * len(self.selected_channels)
+        self.beat_events = []
+
+        # Streaming EMG stage. Samples are held back until the R-peaks around them are confirmed,
+        # so the QRS complexes can be blanked before filtering.
+        self.emg_stage = EMGEnvelope(sample_rate, len(self.selected_channels), EMG_average_window_duration,
+                                     lowcut=emg_band[0], highcut=emg_band[1], order=filter_order)
+        print(f"EMG Bandpass Filter: {self.emg_stage.band[0]} Hz - {self.emg_stage.band[1]} Hz, "
+              f"envelope delay {self.emg_stage.group_delay:.2f} s")
+        self.envelope_store = RingBuffer(len(self.selected_channels), self.buffer_size)
+        self.qrs_blanker = QRSBlanker(sample_rate, len(self.selected_channels), method=qrs_removal)
+        detector = self.peak_detector
+        self.emg_lag = detector.spacing + detector.window_size + detector.filter_delay + 1 + self.qrs_blanker.context
+        self.emg_cursor = 0
+        self.emg_paused = False
+
+    @property
+    def ready(self):
+        ''' Metrics need at least two seconds of signal
+        '''
+        return len(self.sample_store) >= 2 * self.sample_rate
+
+    def ingest(self, samples, timestamps):
+        ''' Store a chunk as returned by pull_chunk and run the streaming detect stage on it
+        '''
+        with INSTRUMENTS.span("ingest"):
+            write_cursor = self.sample_store.count
+            self.sample_store.extend(samples, timestamps)
+            new_samples, _ = self.sample_store.since(write_cursor)
+        with INSTRUMENTS.span("detect"):
+            self.detect(new_samples)
+        INSTRUMENTS.count("samples_processed", len(timestamps))
+
+    def detect(self, new_samples):
+        ''' Only the new chunk goes through the detector, confirmed R-peaks are kept by absolute index
+        '''
+        channel_peaks = self.peak_detector.update(new_samples[self.selected_channels])
+        for channel_index, new_peaks in enumerate(channel_peaks):
+            self.detected_peaks[channel_index].extend(new_peaks)
+            self.qrs_blanker.add_peaks(channel_index, new_peaks)
+            new_peaks = new_peaks[new_peaks >= self.sample_store.start]
+            if new_peaks.size == 0:
+                continue
+            beat_times = self.sample_store.timestamps_at(new_peaks)
+            windows = self.beat_windows(channel_index, new_peaks)
+            accepted, scores = self.quality.check_beats(channel_index, beat_times, windows)
+            for beat_time, beat_accepted in zip(beat_times, accepted):
+                self.hrv[channel_index].add_beat(beat_time, beat_accepted)
+            INSTRUMENTS.count("beats_rejected", int(len(accepted) - np.count_nonzero(accepted)))
+            self.beat_events.append(self.beat_event_rows(channel_index, beat_times, windows, scores))
+
+    def beat_event_rows(self, channel_index, beat_times, windows, scores):
+        ''' Rows of [time, IBI, amplitude, quality, channel] for the RPeaks stream
+
+        The IBI is 0 for the first beat of a channel, the amplitude is the R-peak above the mean of its window.
+        '''
+        previous = self.last_beat_times[channel_index]
+        self.last_beat_times[channel_index] = beat_times[-1]
+        ibis = np.diff(beat_times, prepend=beat_times[0] if previous is None else previous)
+        amplitudes = windows[:, self.quality.half_width] - windows.mean(axis=1)
+        return np.column_stack((beat_times, ibis, amplitudes, scores, np.full(len(beat_times), channel_index)))
+
+    def beat_windows(self, channel_index, peaks):
+        ''' Raw ECG around absolute R-peak indices, shape (beats, samples), clipped to the buffer
+        '''
+        store = self.sample_store
+        half_width = self.quality.half_width
+        indices = np.clip(peaks[:, np.newaxis] + np.arange(-half_width, half_width + 1), store.start, store.count - 1)
+        return store.samples()[self.selected_channels[channel_index], indices - store.start]
+
+    def window_peaks(self, channel_index):
+        ''' Drop peaks that fell out of the buffer and convert the rest to buffer indices
+        '''
+        buffer_start = self.sample_store.start
+        channel_peaks = self.detected_peaks[channel_index]
+        while channel_peaks and channel_peaks[0] < buffer_start:
+            channel_peaks.popleft()
+        return np.array(channel_peaks, dtype=int) - buffer_start
+
+    def signal_quality(self, signals, now):
+        ''' Quality index of every channel over the last quality window
+        '''
+        window_size = self.quality.window_size
+        filtered = self.peak_detector.recent_filtered(window_size)
+        return [
+            self.quality.window_quality(channel_index, signals[channel_index, -window_size:], filtered[channel_index], now)
+            for channel_index in range(len(self.selected_channels))
+        ]
+
+    def metrics(self, channel_index, now, quality=1.0):
+        ''' Heart rate, RMSSD based HRV score, LF/HF ratio and signal quality of one channel
+
+        Below min_quality the metrics are neither computed nor published, they are zero.
+        '''
+        hrv = self.hrv[channel_index]
+        if quality < self.min_quality:
+            hrv.skip(now)
+            INSTRUMENTS.count("metrics_gated")
+            return [0, 0, 0, quality]
+        return hrv.metrics(now) + [quality]
+
+    def emg(self, gated=None):
+        ''' Envelope of the samples whose R-peaks are confirmed, QRS complexes are interpolated away first
+
+        Channels flagged in `gated` (signal quality below min_quality) get a zero envelope. While every
+        channel is gated, blanking and filtering are skipped and the EMG filters restart afterwards.
+        '''
+        store = self.sample_store
+        safe_end = store.count - self.emg_lag
+        start = max(self.emg_cursor, store.start)
+        if safe_end <= start:
+            return
+
+        new_timestamps = store.timestamps(store.count - start)[:safe_end - start]
+        if gated is not None and np.all(gated):
+            self.envelope_store.extend(np.zeros((safe_end - start, len(self.selected_channels))), new_timestamps)
+            self.emg_cursor = safe_end
+            self.emg_paused = True
+            INSTRUMENTS.count("emg_gated", safe_end - start)
+            return
+        if self.emg_paused:
+            self.emg_stage.reset()
+            self.emg_paused = False
+
+        # Blank on the new samples plus enough context on both sides for the gaps around them
+        segment_start = max(start - self.qrs_blanker.context, store.start)
+        segment_end = min(safe_end + self.qrs_blanker.context, store.count)
+        segment = store.samples(store.count - segment_start)[self.selected_channels, :segment_end - segment_start]
+        signals = self.qrs_blanker.update(segment, segment_start)
+
+        new_signals = signals[:, start - segment_start:safe_end - segment_start]
+        envelope = self.emg_stage.update(new_signals)
+        if gated is not None:
+            envelope[gated] = 0
+        self.envelope_store.extend(envelope.T, new_timestamps)
+        self.emg_cursor = safe_end
+
+    def tick(self):
+        ''' Run the metrics and EMG stages over the current window
+        '''
+        timestamps = self.sample_store.timestamps().copy()
+        signals = self.sample_store.samples()[self.selected_channels, :]
+
+        peak_indices = []
+        metrics = []
+        with INSTRUMENTS.span("quality"):
+            quality = self.signal_quality(signals, timestamps[-1])
+        with INSTRUMENTS.span("metrics"):
+            for channel_index in range(len(self.selected_channels)):
+                peak_indices.append(self.window_peaks(channel_index))
+                metrics.append(self.metrics(channel_index, timestamps[-1], quality[channel_index]))
+
+        # The quality of the newest window also gates the EMG samples, which lag behind it by emg_lag
+        with INSTRUMENTS.span("emg"):
+            self.emg(np.array(quality) < self.min_quality)
+        envelopes = self.envelope_store.samples().copy()
+        envelope_timestamps = self.envelope_store.timestamps().copy()
+        new_sample_count = self.envelope_store.count - max(self.last_sent_index, self.envelope_store.start)
+        self.last_sent_index = self.envelope_store.count
+        return Tick(timestamps, signals, peak_indices, metrics, envelopes, envelope_timestamps, new_sample_count,
+                    self.take_beats())
+
+    def take_beats(self):
+        ''' Beat events since the last call, in time order across the channels
+        '''
+        if not self.beat_events:
+            return np.empty((0, 5))
+        beats = np.concatenate(self.beat_events)
+        self.beat_events = []
+        return beats[np.argsort(beats[:, 0], kind='stable')]
@@ -0,0 +1,129 @@
+import numpy as np
+
+# -----------------------------------------------------------------------------------
+# POLAR MEASUREMENT DATA (PMD) FRAMES
+# Every notification on the PMD data characteristic is one frame:
+#   byte 0      measurement type
+#   bytes 1-8   sensor timestamp of the last sample, nanoseconds, uint64 little-endian
+#   byte 9      frame type, bit 7 set for delta compressed frames
+#   bytes 10-   samples
+# -----------------------------------------------------------------------------------
+PMD_ECG = 0x00
+PMD_PPG = 0x01
+PMD_ACC = 0x02
+PMD_GYRO = 0x05
+PMD_MAG = 0x06
+
+HEADER_SIZE = 10
+COMPRESSED_FLAG = 0x80
+
+# (measurement type, frame type) => (channels, bytes per sample value)
+SAMPLE_FORMATS = {
+    (PMD_ECG, 0x00): (1, 3),
+    (PMD_PPG, 0x00): (4, 3),
+    (PMD_ACC, 0x00): (3, 1),
+    (PMD_ACC, 0x01): (3, 2),
+    (PMD_ACC, 0x02): (3, 3),
+    (PMD_GYRO, 0x01): (3, 2),
+    (PMD_MAG, 0x01): (3, 2),
+}
+
+
+class PmdFrame:
+    """ One decoded PMD notification.
+
+    Params:
+        measurement_type (int) : PMD_ECG, PMD_ACC, ...
+        timestamp (int) : Sensor timestamp of the last sample in nanoseconds
+        frame_type (int) : Frame type without the compression flag
+        compressed (bool) : True for delta compressed frames
+        samples (array) : int32 samples with shape (samples, channels)
+    """
+    def __init__(self, measurement_type, timestamp, frame_type, compressed, samples):
+        self.measurement_type = measurement_type
+        self.timestamp = timestamp
+        self.frame_type = frame_type
+        self.compressed = compressed
+        self.samples = samples
+
+
+def parse_header(data):
+    ''' Returns (measurement type, sensor timestamp in ns, frame type byte) of a PMD frame
+    '''
+    if len(data) < HEADER_SIZE:
+        raise ValueError(f"PMD frame too short: {len(data)} bytes")
+    return data[0], int.from_bytes(data[1:9], byteorder="little", signed=False), data[9]
+
+
+def decode_signed(data, width, offset=0, count=None):
+    ''' Little-endian signed integers of 1, 2 or 3 bytes as an int32 array
+
+    1 and 2 byte values are read as a view, 3 byte values are assembled and sign extended in one step.
+    '''
+    if count is None:
+        count = (len(data) - offset) // width
+    if width == 1:
+        return np.frombuffer(data, dtype='<i1', count=count, offset=offset).astype(np.int32)
+    if width == 2:
+        return np.frombuffer(data, dtype='<i2', count=count, offset=offset).astype(np.int32)
+    if width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8, count=count * 3, offset=offset).reshape(count, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return (values << 8) >> 8  # sign extension of the 24-bit value
+    raise ValueError(f"Unsupported sample width: {width} bytes")
+
+
+def decode_ecg(data):
+    ''' Fast path for uncompressed ECG frames, returns the samples in microvolts as float32
+    '''
+    return decode_signed(data, 3, offset=HEADER_SIZE).astype(np.float32)
+
+
+def decode_frame(data):
+    ''' Decode the header and all samples of a PMD frame
+
+    Returns:
+        PmdFrame
+    '''
+    measurement_type, timestamp, frame_type = parse_header(data)
+    compressed = bool(frame_type & COMPRESSED_FLAG)
+    frame_type &= ~COMPRESSED_FLAG
+    sample_format = SAMPLE_FORMATS.get((measurement_type, frame_type))
+    if sample_format is None:
+        raise ValueError(f"Unsupported PMD frame: measurement type {measurement_type}, frame type {frame_type}")
+    channels, width = sample_format
+
+    if compressed:
+        samples = decode_delta_frame(data, channels, width)
+    else:
+        samples = decode_signed(data, width, offset=HEADER_SIZE)
+        samples = samples[:samples.size - samples.size % channels].reshape(-1, channels)
+    return PmdFrame(measurement_type, timestamp, frame_type, compressed, samples)
+
+
+def decode_delta_frame(data, channels, width):
+    ''' Decode a delta compressed payload
+
+    The payload starts with a reference sample (`channels` values of `width` bytes), followed by
+    blocks of [delta bit width (1 byte), sample count (1 byte), packed deltas]. Deltas are signed,
+    packed least significant bit first and added cumulatively to the reference sample.
+    '''
+    reference = decode_signed(data, width, offset=HEADER_SIZE, count=channels)
+    offset = HEADER_SIZE + channels * width
+    payload = np.frombuffer(data, dtype=np.uint8)
+
+    blocks = [reference[np.newaxis, :]]
+    while offset + 2 <= len(data):
+        bit_width, sample_count = data[offset], data[offset + 1]
+        offset += 2
+        value_count = sample_count * channels
+        byte_count = (value_count * bit_width + 7) // 8
+        if bit_width == 0 or offset + byte_count > len(data):
+            break
+        bits = np.unpackbits(payload[offset:offset + byte_count], bitorder='little')[:value_count * bit_width]
+        deltas = bits.reshape(value_count, bit_width).astype(np.int64) @ (1 << np.arange(bit_width, dtype=np.int64))
+        deltas -= (deltas >> (bit_width - 1)) << bit_width  # two's complement of bit_width bits
+        blocks.append(deltas.reshape(sample_count, channels))
+        offset += byte_count
+
+    return np.cumsum(np.concatenate(blocks), axis=0).astype(np.int32)
@@ -0,0 +1,97 @@
+from pylsl import StreamInlet, resolve_byprop
+
+from config import load_config, pipeline_options
+from instrumentation import INSTRUMENTS
+from publisher import Publisher
+from scheduler import ChunkReader, DeadlineClock
+
+# -----------------------------------------------------------------------------------
+# DATA-PROCESSING LOOP
+# This listens for the ECG LSL stream, applies filtering and Pan-Tompkins, then creates EMG derivative streams, etc.
+# scipy comes in with the pipeline on the first call, matplotlib only with the live plot.
+# -----------------------------------------------------------------------------------
+def data_processing_main(headless=False, source_id=None, output_suffix="", backend=None, config=None):
+    from pipeline import ProcessingPipeline
+
+    if config is None:
+        config = load_config()
+    processing = config["processing"]
+    compute_rate = processing["compute_rate"]
+    backend = backend or processing["backend"]
+
+    if source_id is None:
+        print("Looking for an ECG stream...")
+        streams = resolve_byprop('type', 'ECG')
+    else:
+        print(f"Looking for ECG stream {source_id}...")
+        streams = resolve_byprop('source_id', source_id)
+    if not streams:
+        raise RuntimeError("No ECG streams found.")
+
+    inlet = StreamInlet(streams[0])
+    info_inlet = inlet.info()
+    channel_count = info_inlet.channel_count()
+    print(f"Stream has {channel_count} channels.")
+
+    ecg_channels = processing["ecg_channels"]
+    selected_channels = [channel for channel in ecg_channels if channel < channel_count]
+    if not selected_channels:
+        raise RuntimeError(f"None of the ECG channels {ecg_channels} exist in a stream with {channel_count} channels.")
+    selected_channel_count = len(selected_channels)
+    print(f"Selected channels: {selected_channels}")
+
+    sample_rate = int(inlet.info().nominal_srate())
+    options = pipeline_options(config, selected_channels)
+    publisher = Publisher(sample_rate, selected_channel_count, compute_rate, output_suffix,
+                          processing["metrics_resend_interval"], processing["max_buffered"])
+
+    # Chunks are ingested as soon as they arrive, outputs are published on the compute_rate deadlines
+    reader = ChunkReader(inlet, max_samples=max(sample_rate, 256))
+    clock = DeadlineClock(1.0 / compute_rate)
+
+    if backend == "process":
+        # DSP in a worker process, samples go through shared memory and this thread only moves data
+        from workers import ProcessBackend
+        if not headless:
+            print("The live plot is not available with the process backend, running headless.")
+        dsp = ProcessBackend(sample_rate, channel_count, compute_rate=compute_rate, **options)
+        try:
+            while True:
+                samples, timestamps = reader.pull(timeout=clock.time_left())
+                if len(timestamps) > 0:
+                    dsp.push(samples, timestamps)
+                    INSTRUMENTS.count("chunks_in")
+                if clock.poll():
+                    for tick in dsp.results():
+                        publisher.publish(tick)
+        finally:
+            dsp.close()
+
+    pipeline = ProcessingPipeline(sample_rate, channel_count, **options)
+
+    # The live plot runs in its own thread, headless mode never imports matplotlib
+    renderer = None
+    if not headless:
+        from renderer import Renderer
+        renderer = Renderer(selected_channel_count, processing["plot_length"], processing["EMG_average_window_duration"])
+        renderer.start()
+
+    # Main loop reading from LSL and processing
+    while True:
+        samples, timestamps = reader.pull(timeout=clock.time_left())
+        if len(timestamps) > 0:
+            INSTRUMENTS.count("chunks_in")
+            # Ingest and detect run on every chunk, the other stages on the deadlines once the buffer holds enough signal
+            pipeline.ingest(samples, timestamps)
+
+        ticks = clock.poll()
+        if ticks == 0 or not pipeline.ready:
+            continue
+        if INSTRUMENTS.enabled:
+            INSTRUMENTS.gauge("inlet_backlog", inlet.samples_available())
+        for _ in range(ticks):
+            tick = pipeline.tick()
+            publisher.publish(tick)
+
+        if renderer is not None:
+            renderer.submit(tick)
@@ -0,0 +1,119 @@
+import numpy as np
+from pylsl import IRREGULAR_RATE, StreamInfo, StreamOutlet, local_clock
+
+from instrumentation import INSTRUMENTS
+
+# -----------------------------------------------------------------------------------
+# LSL PUBLISHING
+# The output streams of one processed ECG stream. Every push goes through a preallocated
+# float32 buffer in the sample layout of the outlet, which pylsl hands to liblsl as is.
+#   EMG_activity      regular, the envelope samples of every tick in one chunk
+#   HRV_HR_Measures   irregular, only when a metric changed or resend_interval passed
+#   RPeaks            irregular, one event per confirmed beat, stamped with the R-peak time
+# -----------------------------------------------------------------------------------
+METRIC_LABELS = ("heart_rate", "hrv_score", "lf_hf_ratio", "quality")
+BEAT_LABELS = ("ibi", "amplitude", "quality", "channel")
+
+
+def make_outlet(name, stream_type, labels, sample_rate, source_id, chunk_size=0, max_buffered=360):
+    ''' float32 outlet with one labelled channel per entry of `labels`
+    '''
+    info = StreamInfo(name, stream_type, len(labels), sample_rate, 'float32', source_id)
+    channels = info.desc().append_child("channels")
+    for label in labels:
+        channels.append_child("channel").append_child_value("label", label)
+    return StreamOutlet(info, chunk_size=chunk_size, max_buffered=max_buffered)
+
+
+class Publisher:
+    """ EMG_activity, HRV_HR_Measures and RPeaks outlets of one processed ECG stream.
+
+    HRV_HR_Measures carries one sample per channel, in channel order, whenever it is sent.
+    RPeaks events are [IBI (s), amplitude (uV), quality (0-1), channel] and the IBI is 0
+    for the first beat of a channel.
+
+    Params:
+        sample_rate (float) : Sample rate of the ECG and of the EMG envelope
+        channel_count (int) : Processed ECG channels
+        compute_rate (float) : Ticks per second, the EMG outlet sends one tick of samples per chunk
+        output_suffix (str) : Appended to the stream names and source ids
+        resend_interval (float) : Seconds after which unchanged metrics are sent again, 0 sends every tick
+        max_buffered (int) : Seconds of samples an outlet keeps for a slow consumer,
+            hundreds of samples for the irregular streams
+    """
+    def __init__(self, sample_rate, channel_count, compute_rate=10.0, output_suffix="", resend_interval=1.0,
+                 max_buffered=10):
+        self.channel_count = channel_count
+        self.resend_interval = resend_interval
+        tick_size = max(int(round(sample_rate / compute_rate)), 1)
+
+        self.emg_outlet = make_outlet('EMG_activity' + output_suffix, 'EMG',
+                                      [f"emg_{channel + 1}" for channel in range(channel_count)],
+                                      sample_rate, 'emg_source' + output_suffix, tick_size, max_buffered)
+        self.hrv_outlet = make_outlet('HRV_HR_Measures' + output_suffix, 'ECG', METRIC_LABELS, IRREGULAR_RATE,
+                                      'hrv_hr_source' + output_suffix, max_buffered=max_buffered)
+        self.beat_outlet = make_outlet('RPeaks' + output_suffix, 'Markers', BEAT_LABELS, IRREGULAR_RATE,
+                                       'rpeaks_source' + output_suffix, max_buffered=max_buffered)
+
+        self._metrics = np.zeros((channel_count, len(METRIC_LABELS)), dtype=np.float32)
+        self._sent_metrics = np.full_like(self._metrics, np.nan)
+        self._sent_time = -np.inf
+        self._envelope = np.zeros((2 * tick_size, channel_count), dtype=np.float32)
+        self._beats = np.zeros((16, len(BEAT_LABELS)), dtype=np.float32)
+
+    def publish(self, tick):
+        ''' Push the metrics if they changed, the new beats and the EMG samples that were not sent yet
+        '''
+        with INSTRUMENTS.span("publish"):
+            metrics_sent = self.publish_metrics(tick.metrics, tick.timestamps[-1])
+            self.publish_beats(tick.beats)
+            self.publish_envelope(tick.envelopes, tick.envelope_timestamps, tick.new_sample_count)
+
+        if INSTRUMENTS.enabled:
+            # End-to-end latency: LSL timestamp of the newest sample that went into an output => push
+            now = local_clock()
+            if metrics_sent:
+                INSTRUMENTS.observe("latency_hrv", now - tick.timestamps[-1])
+                INSTRUMENTS.count("hrv_samples_out", self.channel_count)
+            if len(tick.beats) > 0:
+                INSTRUMENTS.observe("latency_beats", now - tick.beats[-1, 0])
+                INSTRUMENTS.count("beats_out", len(tick.beats))
+            if tick.new_sample_count > 0:
+                INSTRUMENTS.observe("latency_emg", now - tick.envelope_timestamps[-1])
+                INSTRUMENTS.count("emg_samples_out", tick.new_sample_count)
+
+    def publish_metrics(self, metrics, timestamp):
+        ''' Send the metrics of all channels as one chunk, stamped with the newest sample they cover
+
+        Returns:
+            bool: Whether they were sent.
+        '''
+        np.copyto(self._metrics, metrics)
+        unchanged = np.array_equal(self._metrics, self._sent_metrics)
+        if unchanged and timestamp - self._sent_time < self.resend_interval:
+            return False
+        self.hrv_outlet.push_chunk(self._metrics, [timestamp] * self.channel_count)
+        self._sent_metrics[:] = self._metrics
+        self._sent_time = timestamp
+        return True
+
+    def publish_beats(self, beats):
+        ''' Send beat events, rows of [time, IBI, amplitude, quality, channel]
+        '''
+        count = len(beats)
+        if count == 0:
+            return
+        if count > len(self._beats):
+            self._beats = np.zeros((2 * count, len(BEAT_LABELS)), dtype=np.float32)
+        np.copyto(self._beats[:count], beats[:, 1:])
+        self.beat_outlet.push_chunk(self._beats[:count], beats[:, 0].tolist())
+
+    def publish_envelope(self, envelopes, timestamps, count):
+        ''' Send the last `count` samples of the envelope, shape (channels, samples)
+        '''
+        if count <= 0:
+            return
+        if count > len(self._envelope):
+            self._envelope = np.zeros((2 * count, self.channel_count), dtype=np.float32)
+        np.copyto(self._envelope[:count], envelopes[:, envelopes.shape[1] - count:].T)
+        self.emg_outlet.push_chunk(self._envelope[:count], timestamps[len(timestamps) - count:].tolist())
@@ -0,0 +1,147 @@
+import numpy as np
+from collections import deque
+
+# -----------------------------------------------------------------------------------
+# QRS REMOVAL
+# Blanks the QRS complexes of a streamed ECG before the EMG stage. Only the samples
+# around known R-peaks are touched, the cost per call follows the segment length.
+# -----------------------------------------------------------------------------------
+class QRSBlanker:
+    """ Streaming QRS removal around known R-peaks.
+
+    'interpolate' replaces [peak - before, peak + after) with a straight line between the
+    samples next to the gap. 'template' subtracts a running average beat instead, aligned
+    and scaled to every beat, which keeps the EMG under the QRS complex. The template pays
+    off at higher sample rates, at the 130 Hz of the Polar H10 a QRS is only a few samples
+    wide and interpolation leaves less residue.
+
+    R-peaks are handed over once with add_peaks(), segments are cleaned with update().
+    A segment has to reach `before + after` samples past the samples that are used,
+    so every gap has its anchors (or its whole beat for the template).
+
+    Params:
+        sample_rate (int)
+        channel_count (int)
+        before, after (float) : Seconds removed before and after each R-peak
+        method (str) : 'interpolate' or 'template'
+        template_beats (int) : Number of beats the running average template follows
+    """
+    def __init__(self, sample_rate, channel_count=1, before=0.075, after=0.025, method='interpolate',
+                 template_beats=8):
+        assert method in ('interpolate', 'template'), "method should be 'interpolate' or 'template'"
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.before = int(before * sample_rate)
+        self.after = int(after * sample_rate)
+        self.context = self.before + self.after
+        self.method = method
+        self.template_beats = template_beats
+
+        self.offsets = np.arange(-self.before, self.after)
+        self.peaks = [deque() for _ in range(channel_count)]
+        self.templates = np.zeros((channel_count, len(self.offsets)))
+        self.template_counts = np.zeros(channel_count, dtype=int)
+        self._last_template_peak = np.full(channel_count, -1, dtype=np.int64)
+
+    def add_peaks(self, channel_index, peaks):
+        ''' Register new absolute R-peak indices of one channel, in order
+        '''
+        self.peaks[channel_index].extend(int(peak) for peak in peaks)
+
+    def update(self, segment, segment_start):
+        ''' Remove the QRS complexes from a segment
+
+        Params:
+            segment (array): Samples with shape (channels, samples).
+            segment_start (int): Absolute index of the first sample.
+
+        Returns:
+            array: Cleaned copy of the segment.
+        '''
+        cleaned = np.array(segment, dtype=float, ndmin=2)
+        length = cleaned.shape[1]
+        for channel_index in range(self.channel_count):
+            peaks = self._segment_peaks(channel_index, segment_start, length)
+            if len(peaks) == 0:
+                continue
+            if self.method == 'template':
+                self._subtract_template(channel_index, cleaned[channel_index], peaks, segment_start)
+            else:
+                self._interpolate(cleaned[channel_index], peaks)
+        return cleaned
+
+    def _segment_peaks(self, channel_index, segment_start, length):
+        ''' Peaks whose window overlaps the segment, relative to its start. Older peaks are dropped
+        '''
+        channel_peaks = self.peaks[channel_index]
+        while channel_peaks and channel_peaks[0] + self.after <= segment_start:
+            channel_peaks.popleft()
+        peaks = np.fromiter(channel_peaks, dtype=np.int64, count=len(channel_peaks)) - segment_start
+        return peaks[peaks - self.before < length]
+
+    def _interpolate(self, signal, peaks):
+        # Gap mask from the window edges: +1 where a window starts, -1 after it ends
+        length = len(signal)
+        edges = np.zeros(length + 1, dtype=int)
+        np.add.at(edges, np.clip(peaks - self.before, 0, length), 1)
+        np.add.at(edges, np.clip(peaks + self.after, 0, length), -1)
+        gap = np.cumsum(edges[:-1]) > 0
+        if gap.all():
+            return
+        index = np.arange(length)
+        signal[gap] = np.interp(index[gap], index[~gap], signal[~gap])
+
+    def _subtract_template(self, channel_index, signal, peaks, segment_start):
+        # Windows one sample wider on both sides, so every beat can be aligned to the template
+        windows = peaks[:, np.newaxis] + np.arange(-self.before - 1, self.after + 1)
+        complete = ((windows >= 0) & (windows < len(signal))).all(axis=1)
+        windows, peaks = windows[complete], peaks[complete]
+        if len(peaks) == 0:
+            return
+        beats = self._detrend(signal[windows])
+
+        # Beats that are new to the template are aligned and averaged in first
+        learn = peaks + segment_start > self._last_template_peak[channel_index]
+        if learn.any():
+            template = self.templates[channel_index]
+            if self.template_counts[channel_index] > 0:
+                aligned = self._shift(beats[learn], self._lag(beats[learn], template))
+            else:
+                aligned = beats[learn, 1:-1]
+            for beat in self._detrend(aligned):
+                self.template_counts[channel_index] = min(self.template_counts[channel_index] + 1, self.template_beats)
+                self.templates[channel_index] += (beat - self.templates[channel_index]) / self.template_counts[channel_index]
+            self._last_template_peak[channel_index] = peaks[learn][-1] + segment_start
+
+        # Template moved by the sub-sample lag and scaled to each beat by least squares,
+        # windows never overlap since the refractory period is longer than a window
+        template = self.templates[channel_index]
+        fitted = self._shift(np.pad(template, 1, mode='edge')[np.newaxis, :].repeat(len(peaks), axis=0),
+                             -self._lag(beats, template))
+        gain = (fitted * beats[:, 1:-1]).sum(axis=1) / np.maximum((fitted * fitted).sum(axis=1), 1e-12)
+        signal[windows[:, 1:-1]] -= gain[:, np.newaxis] * fitted
+
+    def _lag(self, beats, template):
+        ''' Sub-sample lag of each widened beat against the template, parabolic fit of the correlation
+        '''
+        length = len(template)
+        correlation = np.stack([beats[:, lag:lag + length] @ template for lag in range(3)], axis=1)
+        curvature = correlation[:, 0] - 2 * correlation[:, 1] + correlation[:, 2]
+        lag = np.where(curvature < 0, 0.5 * (correlation[:, 0] - correlation[:, 2]) / np.where(curvature < 0, curvature, 1), 0)
+        return np.clip(lag, -1, 1)
+
+    @staticmethod
+    def _shift(rows, lags):
+        ''' Linear interpolation of widened rows at the inner positions moved by `lags` samples
+        '''
+        position = np.arange(1, rows.shape[1] - 1) + lags[:, np.newaxis]
+        left = np.clip(np.floor(position).astype(int), 0, rows.shape[1] - 2)
+        fraction = position - left
+        return (1 - fraction) * np.take_along_axis(rows, left, axis=1) + fraction * np.take_along_axis(rows, left + 1, axis=1)
+
+    @staticmethod
+    def _detrend(rows):
+        ''' Remove the line between the first and last sample of each row
+        '''
+        ramp = np.linspace(0, 1, rows.shape[1])
+        return rows - (rows[:, :1] + (rows[:, -1:] - rows[:, :1]) * ramp)
@@ -0,0 +1,151 @@
+import numpy as np
+from collections import deque
+
+# -----------------------------------------------------------------------------------
+# SIGNAL QUALITY
+# A cheap per-channel quality index of the ECG, so metrics of segments without electrode
+# contact or full of artifacts are not computed and do not reach the consumers.
+# -----------------------------------------------------------------------------------
+class SignalQuality:
+    """ Signal-quality index (0 = unusable, 1 = clean) of every ECG channel, plus beat-by-beat artifact gating.
+
+    Beat checks, run once per confirmed R-peak:
+        - implausible IBI: outside [min_ibi, max_ibi] seconds
+        - ectopic IBI: more than `ectopic_tolerance` away from the median of the recent accepted IBIs
+        - morphology: correlation with the running average beat below `min_correlation`
+    Window checks, run once per tick over the last `window_duration` seconds:
+        - flat line: standard deviation of the raw ECG below `flat_threshold`
+        - saturation: more than `saturation_fraction` of the samples stuck at the window's extremes
+        - kurtosis of the bandpass filtered ECG: sharp QRS complexes make it large, noise brings it down to 3
+        - accepted beats: fraction of the beats in the window that passed the beat checks, 0 without beats
+
+    The index is 0 without contact (flat or saturated), otherwise the lower of the kurtosis and beat scores.
+
+    Params:
+        sample_rate (int)
+        channel_count (int)
+        window_duration (float) : Seconds of signal the window checks look at
+        flat_threshold (float) : Standard deviation below which the raw ECG counts as flat, in its units (uV)
+        saturation_fraction (float) : Fraction of the window at the extremes above which the ECG counts as clipped
+        kurtosis_threshold (float) : Kurtosis of the filtered ECG that scores 1, Gaussian noise (3) scores 0
+        min_ibi, max_ibi (float) : Plausible IBI range in seconds (200 to 30 BPM)
+        ectopic_tolerance (float) : Largest relative deviation of an IBI from the recent median
+        min_correlation (float) : Smallest correlation of a beat with the average beat
+        template_beats (int) : Beats averaged into the template before the morphology check starts
+        beat_width (float) : Seconds on each side of the R-peak compared with the template
+    """
+    def __init__(self, sample_rate, channel_count=1, window_duration=4.0, flat_threshold=5.0, saturation_fraction=0.02,
+                 kurtosis_threshold=5.0, min_ibi=0.3, max_ibi=2.0, ectopic_tolerance=0.3, min_correlation=0.6,
+                 template_beats=8, beat_width=0.06):
+        self.sample_rate = sample_rate
+        self.channel_count = channel_count
+        self.window_duration = window_duration
+        self.window_size = int(window_duration * sample_rate)
+        self.flat_threshold = flat_threshold
+        self.saturation_fraction = saturation_fraction
+        self.kurtosis_threshold = kurtosis_threshold
+        self.min_ibi = min_ibi
+        self.max_ibi = max_ibi
+        self.ectopic_tolerance = ectopic_tolerance
+        self.min_correlation = min_correlation
+        self.template_beats = template_beats
+        self.half_width = max(int(beat_width * sample_rate), 1)
+
+        self._last_beat = [None] * channel_count
+        self._ibis = [deque(maxlen=8) for _ in range(channel_count)]
+        self._rejections = [0] * channel_count
+        self._templates = [None] * channel_count
+        self._template_counts = [0] * channel_count
+        self._beats = [deque() for _ in range(channel_count)]  # (beat time, accepted) in the window
+
+    def check_beats(self, channel_index, beat_times, beats):
+        ''' Accept or reject new beats of one channel
+
+        Params:
+            beat_times (array): R-peak times in seconds, in order.
+            beats (array): Raw ECG around every R-peak, shape (beats, 2 * half_width + 1).
+
+        Returns:
+            (accepted, scores): True for the beats that may enter the HRV metrics, and the
+            correlation of every beat with the average beat (1 until the template is ready,
+            0 for beats rejected on their IBI).
+        '''
+        accepted = np.zeros(len(beat_times), dtype=bool)
+        scores = np.zeros(len(beat_times))
+        for index, (beat_time, beat) in enumerate(zip(beat_times, beats)):
+            beat = beat - beat.mean()
+            if self._check_ibi(channel_index, beat_time):
+                scores[index] = self._correlation(channel_index, beat)
+                accepted[index] = scores[index] >= self.min_correlation
+            if accepted[index]:
+                self._update_template(channel_index, beat)
+            self._beats[channel_index].append((beat_time, accepted[index]))
+        return accepted, scores
+
+    def _check_ibi(self, channel_index, beat_time):
+        last_beat = self._last_beat[channel_index]
+        self._last_beat[channel_index] = beat_time
+        if last_beat is None:
+            return True
+        ibi = beat_time - last_beat
+        ibis = self._ibis[channel_index]
+        plausible = self.min_ibi <= ibi <= self.max_ibi
+        if plausible and len(ibis) >= 3:
+            median = np.median(ibis)
+            plausible = abs(ibi - median) <= self.ectopic_tolerance * median
+        if plausible:
+            self._rejections[channel_index] = 0
+            ibis.append(ibi)
+            return True
+        self._rejections[channel_index] += 1
+        if self._rejections[channel_index] >= 3 and self.min_ibi <= ibi <= self.max_ibi:
+            # Three rejections in a row are a change of rhythm rather than ectopic beats, start over
+            self._rejections[channel_index] = 0
+            ibis.clear()
+            ibis.append(ibi)
+            return True
+        return False
+
+    def _correlation(self, channel_index, beat):
+        template = self._templates[channel_index]
+        if template is None or self._template_counts[channel_index] < self.template_beats:
+            return 1.0
+        norm = np.sqrt(np.dot(beat, beat) * np.dot(template, template))
+        return max(np.dot(beat, template) / norm, 0.0) if norm > 0 else 0.0
+
+    def _update_template(self, channel_index, beat):
+        # Average of the first accepted beats, then an exponential average
+        count = self._template_counts[channel_index]
+        template = self._templates[channel_index]
+        weight = 1.0 / min(count + 1, self.template_beats)
+        self._templates[channel_index] = beat if template is None else (1 - weight) * template + weight * beat
+        self._template_counts[channel_index] = count + 1
+
+    def window_quality(self, channel_index, raw, filtered, now):
+        ''' Quality index of the last window of one channel
+
+        Params:
+            raw (array): Raw ECG of the last window_duration seconds.
+            filtered (array): Bandpass filtered ECG of the same window.
+            now (float): Time of the newest sample, for the beat checks.
+        '''
+        beats = self._beats[channel_index]
+        while beats and beats[0][0] < now - self.window_duration:
+            beats.popleft()
+
+        # No contact: flat line or clipped at the rails
+        if len(raw) < 2 or np.std(raw) < self.flat_threshold:
+            return 0.0
+        low, high = raw.min(), raw.max()
+        tolerance = 1e-3 * (high - low)
+        if np.count_nonzero((raw <= low + tolerance) | (raw >= high - tolerance)) > self.saturation_fraction * len(raw):
+            return 0.0
+
+        centred = filtered - filtered.mean()
+        variance = np.dot(centred, centred) / len(centred)
+        kurtosis = np.dot(centred ** 2, centred ** 2) / len(centred) / variance ** 2 if variance > 0 else 0.0
+        kurtosis_score = np.clip((kurtosis - 3.0) / (self.kurtosis_threshold - 3.0), 0.0, 1.0)
+
+        beat_score = np.mean([accepted for _, accepted in beats]) if beats else 0.0
+        # Reported in steps of 0.01, so a steady signal gives a steady index
+        return round(float(min(kurtosis_score, beat_score)), 2)
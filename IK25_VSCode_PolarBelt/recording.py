@@ -0,0 +1,262 @@
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from pylsl import StreamInfo, StreamInlet, StreamOutlet, local_clock, resolve_byprop
+
+from config import load_config, pipeline_options
+
+# -----------------------------------------------------------------------------------
+# RECORD AND REPLAY
+# A recording is a folder with meta.json and two append-only binary files:
+#   samples.f32     float32, (samples, channels) row by row
+#   timestamps.f64  float64, one LSL timestamp per sample
+# Chunks are appended as they arrive, so a crash loses at most the last chunk, and
+# both files can be memory-mapped without parsing. LabRecorder .xdf files can be
+# replayed as well when pyxdf is installed.
+# -----------------------------------------------------------------------------------
+SAMPLES_FILE = "samples.f32"
+TIMESTAMPS_FILE = "timestamps.f64"
+META_FILE = "meta.json"
+
+
+class Recorder:
+    """ Appends chunks of an LSL stream to a recording folder.
+
+    Params:
+        path (str) : Folder of the recording, created if missing. An existing folder has to be empty,
+            two sessions would otherwise end up in one file under the header of the second
+        sample_rate (float)
+        channel_count (int)
+        name, stream_type, source_id (str) : Stream description, restored on replay
+    """
+    def __init__(self, path, sample_rate, channel_count, name="PolarBand", stream_type="ECG", source_id=""):
+        check_new_recording(path)
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.channel_count = channel_count
+        self.sample_count = 0
+        meta = dict(name=name, type=stream_type, source_id=source_id, sample_rate=sample_rate,
+                    channel_count=channel_count, created=time.strftime("%Y-%m-%dT%H:%M:%S"))
+        with open(os.path.join(path, META_FILE), "w") as f:
+            json.dump(meta, f, indent=2)
+        self._samples = open(os.path.join(path, SAMPLES_FILE), "wb")
+        self._timestamps = open(os.path.join(path, TIMESTAMPS_FILE), "wb")
+
+    def write(self, samples, timestamps):
+        ''' Append a chunk as returned by pull_chunk
+        '''
+        samples = np.asarray(samples, dtype=np.float32).reshape(-1, self.channel_count)
+        samples.tofile(self._samples)
+        np.asarray(timestamps, dtype=np.float64).tofile(self._timestamps)
+        self._samples.flush()
+        self._timestamps.flush()
+        self.sample_count += len(samples)
+
+    def close(self):
+        self._samples.close()
+        self._timestamps.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_new_recording(path):
+    ''' Raise a FileExistsError unless `path` is missing or an empty folder
+    '''
+    if os.path.exists(path) and (not os.path.isdir(path) or os.listdir(path)):
+        raise FileExistsError(f"{path} already exists and is not an empty folder, choose a new recording folder")
+
+
+def _map_file(path, dtype):
+    # np.memmap cannot map an empty file, e.g. of a session stopped before the first chunk
+    if os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def load_recording(path):
+    ''' Open a recording folder (memory-mapped) or the first ECG stream of an .xdf file
+
+    Returns:
+        (samples (samples, channels), timestamps, meta dict)
+    '''
+    if path.endswith(".xdf"):
+        return _load_xdf(path)
+    with open(os.path.join(path, META_FILE)) as f:
+        meta = json.load(f)
+    timestamps = _map_file(os.path.join(path, TIMESTAMPS_FILE), np.float64)
+    samples = _map_file(os.path.join(path, SAMPLES_FILE), np.float32)
+    samples = samples[:len(samples) - len(samples) % meta["channel_count"]].reshape(-1, meta["channel_count"])
+    # After a crash one of the files may hold a partial chunk
+    length = min(len(samples), len(timestamps))
+    return samples[:length], timestamps[:length], meta
+
+
+def _load_xdf(path):
+    try:
+        import pyxdf
+    except ImportError:
+        raise ImportError("Replaying .xdf files needs pyxdf: pip install pyxdf")
+    streams, _ = pyxdf.load_xdf(path, select_streams=[{'type': 'ECG'}])
+    if not streams:
+        raise RuntimeError(f"No ECG stream in {path}")
+    info = streams[0]["info"]
+    meta = dict(name=info["name"][0], type=info["type"][0], source_id=info["source_id"][0],
+                sample_rate=float(info["nominal_srate"][0]), channel_count=int(info["channel_count"][0]))
+    samples = np.asarray(streams[0]["time_series"], dtype=np.float32).reshape(-1, meta["channel_count"])
+    return samples, np.asarray(streams[0]["time_stamps"], dtype=np.float64), meta
+
+
+# -----------------------------------------------------------------------------------
+# RECORD FROM LSL
+# -----------------------------------------------------------------------------------
+def record(path, source_id=None, duration=None):
+    ''' Record the raw ECG outlet until `duration` seconds passed or Ctrl+C
+    '''
+    check_new_recording(path)
+    if source_id is None:
+        print("Looking for an ECG stream...")
+        streams = resolve_byprop('type', 'ECG')
+    else:
+        print(f"Looking for ECG stream {source_id}...")
+        streams = resolve_byprop('source_id', source_id)
+    if not streams:
+        raise RuntimeError("No ECG streams found.")
+
+    inlet = StreamInlet(streams[0])
+    info = inlet.info()
+    recorder = Recorder(path, info.nominal_srate(), info.channel_count(), info.name(), info.type(), info.source_id())
+    print(f"Recording {info.name()} to {path}, press Ctrl+C to stop.")
+    end_time = None if duration is None else time.monotonic() + duration
+    try:
+        with recorder:
+            while end_time is None or time.monotonic() < end_time:
+                samples, timestamps = inlet.pull_chunk(timeout=1.0)
+                if timestamps:
+                    recorder.write(samples, timestamps)
+    except KeyboardInterrupt:
+        pass
+    print(f"Recorded {recorder.sample_count} samples.")
+    return recorder.sample_count
+
+
+# -----------------------------------------------------------------------------------
+# REPLAY
+# -----------------------------------------------------------------------------------
+def replay_outlet(path, speed=1.0, chunk_size=13, source_id=None):
+    ''' Push a recording to an LSL outlet with its original name, at `speed` times real time.
+
+    Timestamps keep their original spacing and are moved to start at local_clock(),
+    so HR and HRV stay correct at any speed.
+    '''
+    samples, timestamps, meta = load_recording(path)
+    if len(timestamps) == 0:
+        raise ValueError(f"{path} holds no samples.")
+    source_id = source_id or "replay_" + (meta["source_id"] or meta["name"])
+    info = StreamInfo(meta["name"], meta["type"], meta["channel_count"], meta["sample_rate"], 'float32', source_id)
+    outlet = StreamOutlet(info)
+    print(f"Replaying {len(timestamps)} samples as {meta['name']} ({source_id}) at {speed}x")
+
+    offset = local_clock() - timestamps[0]
+    start_time = time.monotonic()
+    for start in range(0, len(timestamps), chunk_size):
+        chunk_timestamps = timestamps[start:start + chunk_size]
+        delay = (chunk_timestamps[-1] - timestamps[0]) / speed - (time.monotonic() - start_time)
+        if delay > 0:
+            time.sleep(delay)
+        outlet.push_chunk(samples[start:start + chunk_size], (chunk_timestamps + offset).tolist())
+    return source_id
+
+
+def replay_batch(path, chunk_size=13, compute_rate=10.0, output=None, **pipeline_options):
+    ''' Run a recording through ProcessingPipeline without LSL, as fast as possible.
+
+    Ticks happen every sample_rate / compute_rate samples of signal time, like the live loop.
+
+    Returns:
+        dict with metric_timestamps, metrics (ticks, channels, 4), beats (beats, 5) as rows of
+        [time, IBI, amplitude, quality, channel], envelope_timestamps and envelopes (samples, channels).
+        Saved with np.savez when `output` is given.
+    '''
+    from pipeline import ProcessingPipeline
+
+    samples, timestamps, meta = load_recording(path)
+    selected_channels = pipeline_options.get("selected_channels", (0,))
+    missing = [channel for channel in selected_channels if not 0 <= channel < meta["channel_count"]]
+    if missing:
+        raise ValueError(f"ECG channels {missing} do not exist in {path}, it has {meta['channel_count']} channels.")
+    sample_rate = int(meta["sample_rate"])
+    pipeline = ProcessingPipeline(sample_rate, meta["channel_count"], **pipeline_options)
+    tick_size = max(int(sample_rate / compute_rate), 1)
+
+    metric_timestamps, metrics, beats = [], [], []
+    envelope_timestamps, envelopes = [], []
+    next_tick = 0
+    start_time = time.perf_counter()
+    for start in range(0, len(timestamps), chunk_size):
+        end = min(start + chunk_size, len(timestamps))
+        pipeline.ingest(np.asarray(samples[start:end]), np.asarray(timestamps[start:end]))
+        if not pipeline.ready or end < next_tick:
+            continue
+        next_tick = end + tick_size
+        tick = pipeline.tick()
+        metric_timestamps.append(tick.timestamps[-1])
+        metrics.append(tick.metrics)
+        beats.append(tick.beats)
+        if tick.new_sample_count > 0:
+            envelope_timestamps.append(tick.envelope_timestamps[-tick.new_sample_count:])
+            envelopes.append(tick.envelopes[:, -tick.new_sample_count:].T)
+    elapsed = time.perf_counter() - start_time
+
+    channel_count = len(pipeline.selected_channels)
+    results = dict(
+        metric_timestamps=np.array(metric_timestamps),
+        metrics=np.array(metrics, dtype=np.float32).reshape(-1, channel_count, 4),
+        beats=np.concatenate(beats) if beats else np.empty((0, 5)),
+        envelope_timestamps=np.concatenate(envelope_timestamps) if envelope_timestamps else np.empty(0),
+        envelopes=np.concatenate(envelopes) if envelopes else np.empty((0, channel_count), dtype=np.float32)
+    )
+    duration = len(timestamps) / sample_rate
+    print(f"Processed {duration:.1f} s of signal in {elapsed:.2f} s ({duration / max(elapsed, 1e-9):.0f}x real time)")
+    if output:
+        np.savez(output, **results)
+        print(f"Results written to {output}")
+    return results
+
+
+def replay(path, speed=1.0, process=False, plot=False, batch=False, output=None, config=None):
+    ''' Replay a recording as an LSL stream, optionally processing it, or process it in batch mode
+    '''
+    if config is None:
+        config = load_config()
+    if batch:
+        replay_batch(path, compute_rate=config["processing"]["compute_rate"], output=output,
+                     **pipeline_options(config, config["processing"]["ecg_channels"]))
+        return
+    source_id = None
+    if process:
+        from processing import data_processing_main
+        _, _, meta = load_recording(path)
+        source_id = "replay_" + (meta["source_id"] or meta["name"])
+        threading.Thread(target=data_processing_main, args=(not plot, source_id, "", None, config), daemon=True).start()
+    replay_outlet(path, speed, source_id=source_id)
+    if process:
+        time.sleep(2.0)  # let the processing publish the last samples
+
+
+# -----------------------------------------------------------------------------------
+# ENTRY POINT
+# -----------------------------------------------------------------------------------
+if __name__ == "__main__":
+    # `python recording.py record|replay ...` is `python cli.py record|replay ...`, the arguments are defined in cli.py
+    from cli import main as cli_main
+    if len(sys.argv) < 2 or sys.argv[1] not in ("record", "replay"):
+        sys.exit("usage: recording.py {record,replay} ...")
+    sys.exit(cli_main(sys.argv[1:]))
@@ -0,0 +1,155 @@
+import threading
+
+import numpy as np
+import matplotlib.pyplot as plt
+
+from instrumentation import INSTRUMENTS
+from scheduler import DeadlineClock
+
+# -----------------------------------------------------------------------------------
+# LIVE PLOT
+# Runs in its own thread at a capped frame rate. The processing loop only hands over
+# the latest Tick, so a slow redraw never delays the LSL outlets. The figure is built
+# and drawn by that thread only, GUI backends like TkAgg reject calls from other threads.
+# -----------------------------------------------------------------------------------
+class Renderer:
+    """ Frame-rate limited matplotlib view of the processing pipeline.
+
+    Lines are updated with set_data and drawn with blitting. The static parts of the
+    figure (axes, titles, legends) are only redrawn when the y-range has to change.
+
+    Params:
+        channel_count (int) : Number of processed channels
+        window_duration (float) : Seconds shown on the time axis
+        EMG_average_window_duration (float) : Seconds cut from the start of the EMG axis
+        fps (float) : Maximum frames per second
+    """
+    def __init__(self, channel_count, window_duration, EMG_average_window_duration=1.0, fps=20.0):
+        self.channel_count = channel_count
+        self.window_duration = window_duration
+        self.EMG_average_window_duration = EMG_average_window_duration
+        self.frame_interval = 1.0 / fps
+        self._latest = None
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._background = None
+
+    def build(self):
+        ''' Create the figure, called by the thread that draws it
+        '''
+        window_duration = self.window_duration
+        channel_count = self.channel_count
+        EMG_average_window_duration = self.EMG_average_window_duration
+        plt.ion()
+        self.fig, axes = plt.subplots(nrows=channel_count, ncols=2, figsize=(10, 3))
+        self.axes = np.atleast_2d(axes)
+        self.original_lines = []
+        self.peak_lines = []
+        self.processed_lines = []
+        self.metric_texts = []
+
+        for i in range(channel_count):
+            original_line, = self.axes[i, 0].plot([], [], label=f'Original Channel {i+1}', animated=True)
+            self.original_lines.append(original_line)
+            self.axes[i, 0].set_title(f"Original Channel {i+1}")
+            self.axes[i, 0].set_xlabel("Time (s)")
+            self.axes[i, 0].set_ylabel("Amplitude")
+            self.axes[i, 0].set_xlim([-window_duration, 0])
+
+            print("ECG found. Adding R-peak lines.")
+            peak_line, = self.axes[i, 0].plot([], [], 'ro', label='R-peaks', animated=True)
+            self.peak_lines.append(peak_line)
+            self.axes[i, 0].legend(loc='upper right')
+
+            # Metrics go into a text artist, so the legend never has to be rebuilt
+            metric_text = self.axes[i, 0].text(0.01, 0.95, '', transform=self.axes[i, 0].transAxes,
+                                               va='top', animated=True)
+            self.metric_texts.append(metric_text)
+
+            processed_line, = self.axes[i, 1].plot([], [], label=f'EMG Channel {i+1}', color='r', animated=True)
+            self.processed_lines.append(processed_line)
+            self.axes[i, 1].set_title(f"EMG Channel {i+1}")
+            self.axes[i, 1].set_xlabel("Time (s)")
+            self.axes[i, 1].set_ylabel("EMG activity")
+            self.axes[i, 1].set_xlim([-window_duration + EMG_average_window_duration, 0])
+            self.axes[i, 1].legend(loc='upper right')
+
+        self.artists = self.original_lines + self.peak_lines + self.metric_texts + self.processed_lines
+        self.fig.canvas.mpl_connect('draw_event', self._on_draw)
+        plt.show(block=False)
+
+    def submit(self, tick):
+        ''' Hand over the latest Tick, called from the processing loop. Older ticks are dropped.
+        This is the only method that may be called from another thread.
+        '''
+        with self._lock:
+            if self._latest is not None:
+                INSTRUMENTS.count("render_dropped")
+            self._latest = tick
+
+    def start(self):
+        thread = threading.Thread(target=self.run, daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def run(self):
+        ''' Draw the latest Tick at most once per frame interval
+        '''
+        self.build()
+        clock = DeadlineClock(self.frame_interval, name="render")
+        while not self._stopped.is_set():
+            with self._lock:
+                tick, self._latest = self._latest, None
+            if tick is not None:
+                with INSTRUMENTS.span("render"):
+                    self.draw(tick)
+            self.fig.canvas.flush_events()
+            clock.wait()
+
+    def draw(self, tick):
+        # Seconds relative to the newest sample, the envelope ends earlier by the EMG stage lag
+        time_axis = tick.timestamps - tick.timestamps[-1]
+        envelope_time_axis = tick.envelope_timestamps - tick.timestamps[-1]
+        rescale = False
+        for i in range(self.channel_count):
+            average_heart_rate_bpm, hrv_score, lf_hf_ratio, quality = tick.metrics[i]
+            self.metric_texts[i].set_text(
+                f'HR: {average_heart_rate_bpm:.2f} BPM, HRV: {hrv_score:.2f}, LF/HF: {lf_hf_ratio:.2f}, '
+                f'Quality: {quality:.2f}'
+            )
+            self.original_lines[i].set_data(time_axis, tick.signals[i])
+
+            # R-peak indices => relative time
+            peak_indices = tick.peak_indices[i]
+            self.peak_lines[i].set_data(time_axis[peak_indices], tick.signals[i][peak_indices])
+
+            self.processed_lines[i].set_data(envelope_time_axis, tick.envelopes[i])
+            rescale |= self._fit_ylim(self.axes[i, 0], tick.signals[i])
+            rescale |= self._fit_ylim(self.axes[i, 1], tick.envelopes[i])
+
+        canvas = self.fig.canvas
+        if rescale or self._background is None:
+            canvas.draw()  # redraws the static parts and stores the new background
+        canvas.restore_region(self._background)
+        for artist in self.artists:
+            self.fig.draw_artist(artist)
+        canvas.blit(self.fig.bbox)
+
+    def _on_draw(self, event):
+        self._background = self.fig.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _fit_ylim(self, ax, data):
+        ''' Widen the y-range when data leaves it, shrink it when data only uses a small part of it
+        '''
+        if len(data) == 0:
+            return False
+        low, high = float(np.min(data)), float(np.max(data))
+        current_low, current_high = ax.get_ylim()
+        if low >= current_low and high <= current_high and (high - low) > 0.5 * (current_high - current_low):
+            return False
+        margin = 0.1 * (high - low) or 1.0
+        ax.set_ylim(low - margin, high + margin)
+        return True
@@ -0,0 +1,98 @@
+import numpy as np
+
+class RingBuffer:
+    """ Preallocated multi-channel sample store with a parallel timestamp ring.
+
+    Every sample is written twice, at its ring position and one capacity further, so the
+    most recent `capacity` samples are always contiguous in memory and windows can be
+    returned as views without copying.
+
+    Positions are absolute write indices: `count` is the number of samples written since
+    creation and acts as write cursor. Keep a cursor and call since(cursor) later to get
+    everything that arrived in between.
+
+    Params:
+        channel_count (int)
+        capacity (int) : Number of samples kept
+    """
+    def __init__(self, channel_count, capacity, dtype=np.float32):
+        self.channel_count = channel_count
+        self.capacity = capacity
+        self._samples = np.zeros((channel_count, 2 * capacity), dtype=dtype)
+        self._timestamps = np.zeros(2 * capacity, dtype=np.float64)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def start(self):
+        ''' Absolute index of the oldest sample still in the buffer
+        '''
+        return self.count - len(self)
+
+    def extend(self, samples, timestamps):
+        ''' Append a chunk as returned by pull_chunk
+
+        Params:
+            samples (array): Samples with shape (samples, channels).
+            timestamps (array): One timestamp per sample.
+        '''
+        samples = np.asarray(samples, dtype=self._samples.dtype)
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if samples.ndim == 1:
+            samples = samples[:, np.newaxis]
+        if len(timestamps) == 0:
+            return
+        count = self.count
+        if len(timestamps) > self.capacity:
+            # Only the newest samples would survive anyway
+            count += len(timestamps) - self.capacity
+            samples = samples[-self.capacity:]
+            timestamps = timestamps[-self.capacity:]
+
+        position = count % self.capacity
+        first = min(len(timestamps), self.capacity - position)
+        for offset in (0, self.capacity):
+            self._samples[:, offset + position:offset + position + first] = samples[:first].T
+            self._timestamps[offset + position:offset + position + first] = timestamps[:first]
+            rest = len(timestamps) - first
+            if rest:
+                self._samples[:, offset:offset + rest] = samples[first:].T
+                self._timestamps[offset:offset + rest] = timestamps[first:]
+        self.count = count + len(timestamps)  # advanced last, readers never see unwritten samples
+
+    def _window(self, start):
+        end = self.count % self.capacity + (self.capacity if self.count >= self.capacity else 0)
+        return slice(end - (self.count - start), end)
+
+    def _last(self, length):
+        return self._window(self.count - (len(self) if length is None else min(length, len(self))))
+
+    def samples(self, length=None):
+        ''' View of the last `length` samples (default: all buffered), shape (channels, length)
+        '''
+        return self._samples[:, self._last(length)]
+
+    def timestamps(self, length=None):
+        ''' View of the timestamps of the last `length` samples
+        '''
+        return self._timestamps[self._last(length)]
+
+    def since(self, cursor):
+        ''' Samples and timestamps written after the absolute index `cursor`
+
+        Samples that already dropped out of the buffer are skipped.
+        '''
+        window = self._window(max(cursor, self.start))
+        return self._samples[:, window], self._timestamps[window]
+
+    def timestamps_at(self, indices):
+        ''' Timestamps of buffered samples given by absolute index
+        '''
+        return self.timestamps()[np.asarray(indices, dtype=np.int64) - self.start]
+
+    def index_of(self, timestamp):
+        ''' Absolute index of the first buffered sample newer than `timestamp`
+        '''
+        return self.start + int(np.searchsorted(self.timestamps(), timestamp, side='right'))
@@ -0,0 +1,111 @@
+import inspect
+import time
+
+import numpy as np
+import pylsl
+
+from instrumentation import INSTRUMENTS
+
+# -----------------------------------------------------------------------------------
+# SCHEDULING
+# The processing loops block on new data until the next deadline instead of sleeping
+# a fixed time, so output timing no longer depends on how long the work took.
+# -----------------------------------------------------------------------------------
+class DeadlineClock:
+    """ Fixed-rate deadlines on the monotonic clock.
+
+    Deadlines stay on a grid of `interval` seconds. When a deadline is missed by more
+    than an interval, up to `max_catch_up` extra ticks are run and the rest are skipped,
+    so the loop never falls further behind. Overruns are counted, reported at most every
+    `report_interval` seconds and recorded in the instrumentation.
+
+    Params:
+        interval (float) : Seconds between ticks
+        max_catch_up (int) : Missed ticks that are run late instead of skipped
+        name (str) : Prefix of the instrumentation entries and reports
+    """
+    def __init__(self, interval, max_catch_up=0, name="tick", report_interval=10.0):
+        self.interval = interval
+        self.max_catch_up = max_catch_up
+        self.name = name
+        self.report_interval = report_interval
+        self.next_deadline = time.monotonic() + interval
+        self.overruns = 0
+        self.skipped = 0
+        self._last_report = 0.0
+
+    def time_left(self):
+        return max(self.next_deadline - time.monotonic(), 0.0)
+
+    def poll(self):
+        ''' Number of ticks to run now, 0 while the next deadline is still ahead
+        '''
+        now = time.monotonic()
+        if now < self.next_deadline:
+            return 0
+        lateness = now - self.next_deadline
+        missed = int(lateness // self.interval)
+        self.next_deadline += (missed + 1) * self.interval
+        if missed > 0:
+            self._overrun(now, lateness, missed)
+        INSTRUMENTS.observe(self.name + "_lateness", lateness)
+        return 1 + min(missed, self.max_catch_up)
+
+    def wait(self):
+        ''' Sleep until the next deadline, returns the number of ticks to run
+        '''
+        time.sleep(self.time_left())
+        return self.poll()
+
+    def _overrun(self, now, lateness, missed):
+        skipped = max(missed - self.max_catch_up, 0)
+        self.overruns += 1
+        self.skipped += skipped
+        INSTRUMENTS.count(self.name + "_overruns")
+        INSTRUMENTS.count(self.name + "_skipped", skipped)
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            print(f"[{self.name}] {lateness * 1000:.0f} ms behind schedule, {self.skipped} ticks skipped "
+                  f"in {self.overruns} overruns so far.", flush=True)
+
+
+# liblsl channel formats that can be pulled straight into a numpy buffer
+NUMPY_FORMATS = {
+    pylsl.cf_float32: np.float32,
+    pylsl.cf_double64: np.float64,
+    pylsl.cf_int32: np.int32,
+    pylsl.cf_int16: np.int16,
+    pylsl.cf_int8: np.int8,
+}
+
+
+class ChunkReader:
+    """ Pulls chunks of an LSL inlet into one preallocated buffer.
+
+    pull() blocks for up to `timeout` seconds and returns as soon as the first samples are
+    there (with pylsl versions that support min_samples, older ones wait for the timeout or a
+    full buffer). The returned samples are a view into the buffer that is only valid until the
+    next pull().
+
+    Params:
+        inlet (StreamInlet)
+        max_samples (int) : Buffer size in samples, the most one pull can return
+    """
+    def __init__(self, inlet, max_samples=1024):
+        info = inlet.info()
+        self.inlet = inlet
+        self.max_samples = max_samples
+        dtype = NUMPY_FORMATS.get(info.channel_format())
+        self.buffer = None if dtype is None else np.zeros((max_samples, info.channel_count()), dtype=dtype)
+        self._pull_options = {}
+        if "min_samples" in inspect.signature(inlet.pull_chunk).parameters:
+            self._pull_options["min_samples"] = 1
+
+    def pull(self, timeout):
+        ''' Returns (samples (samples, channels), timestamps) of up to max_samples new samples
+        '''
+        if self.buffer is None:
+            samples, timestamps = self.inlet.pull_chunk(timeout, self.max_samples, **self._pull_options)
+            return np.asarray(samples), np.asarray(timestamps)
+        _, timestamps = self.inlet.pull_chunk(timeout, self.max_samples, dest_obj=self.buffer, **self._pull_options)
+        return self.buffer[:len(timestamps)], np.asarray(timestamps)
@@ -0,0 +1,96 @@
+import numpy as np
+
+# -----------------------------------------------------------------------------------
+# SENSOR CLOCK
+# Polar devices stamp every PMD frame with the sensor time of its last sample. Mapping
+# that clock onto pylsl.local_clock() gives per-sample timestamps that are free of BLE
+# delivery jitter, so IBIs and HRV are computed from when the samples were taken.
+# -----------------------------------------------------------------------------------
+class SensorClock:
+    """ Reconstructs per-sample LSL timestamps from PMD sensor timestamps.
+
+    The mapping local = offset + slope * sensor is fitted online with exponentially
+    weighted least squares over (sensor time, arrival time) pairs, so clock drift is
+    followed while single late notifications barely move it. The fitted offset still
+    contains the average BLE delivery delay. Gaps in the sensor timestamps are counted
+    as lost samples.
+
+    Params:
+        sample_rate (float) : Nominal sampling rate of the stream
+        forgetting_factor (float) : Weight kept by old frames per new frame, closer to 1 averages longer
+    """
+    def __init__(self, sample_rate, forgetting_factor=0.995):
+        self.sample_rate = sample_rate
+        self.forgetting_factor = forgetting_factor
+        self.sample_period = 1.0 / sample_rate  # refined from the sensor timestamps
+
+        # Counters
+        self.frames = 0
+        self.samples = 0
+        self.gaps = 0
+        self.lost_samples = 0
+        self.out_of_order = 0
+
+        self._sensor_origin = None
+        self._local_origin = None
+        self._last_sensor_time = None
+        self._sums = np.zeros(5)  # weight, x, y, xx, xy
+
+    @property
+    def slope(self):
+        weight, x, y, xx, xy = self._sums
+        variance = weight * xx - x * x
+        if self.frames < 2 or variance <= 1e-12 * weight * weight:
+            return 1.0
+        return (weight * xy - x * y) / variance
+
+    @property
+    def offset(self):
+        weight, x, y, _, _ = self._sums
+        if weight == 0:
+            return 0.0
+        return (y - self.slope * x) / weight
+
+    def to_local(self, sensor_time):
+        ''' Map sensor time in seconds (relative to the first frame) onto local_clock()
+        '''
+        return self._local_origin + self.offset + self.slope * sensor_time
+
+    def timestamps(self, sensor_timestamp, sample_count, arrival_time):
+        ''' Per-sample local_clock() timestamps of one PMD frame
+
+        Params:
+            sensor_timestamp (int): PMD header timestamp of the last sample in nanoseconds.
+            sample_count (int): Number of samples in the frame.
+            arrival_time (float): local_clock() when the notification arrived.
+
+        Returns:
+            array: float64 timestamps, one per sample.
+        '''
+        if self._sensor_origin is None:
+            self._sensor_origin = sensor_timestamp
+            self._local_origin = arrival_time
+        sensor_time = (sensor_timestamp - self._sensor_origin) * 1e-9
+        local_time = arrival_time - self._local_origin
+
+        if self._last_sensor_time is not None:
+            elapsed = sensor_time - self._last_sensor_time
+            if elapsed <= 0:
+                self.out_of_order += 1
+            else:
+                missing = int(round(elapsed / self.sample_period)) - sample_count
+                if missing > 0:
+                    self.gaps += 1
+                    self.lost_samples += missing
+                else:
+                    # Frame follows the previous one directly, refine the actual sample period
+                    self.sample_period += 0.05 * (elapsed / sample_count - self.sample_period)
+        self._last_sensor_time = max(sensor_time, self._last_sensor_time or sensor_time)
+
+        self._sums *= self.forgetting_factor
+        self._sums += (1.0, sensor_time, local_time, sensor_time * sensor_time, sensor_time * local_time)
+        self.frames += 1
+        self.samples += sample_count
+
+        sample_times = sensor_time - self.sample_period * np.arange(sample_count - 1, -1, -1)
+        return self.to_local(sample_times)
@@ -0,0 +1,94 @@
+import numpy as np
+
+from pmd import PMD_ECG
+
+# -----------------------------------------------------------------------------------
+# SYNTHETIC SIGNALS
+# ECG with known beat times for benchmarks and accuracy checks, no device needed.
+# -----------------------------------------------------------------------------------
+def synthetic_ecg(duration=60.0, sample_rate=130, heart_rate=70.0, rr_variability=0.05, noise=20.0,
+                  powerline=100.0, powerline_freq=50.0, baseline=300.0, emg=0.0, seed=0):
+    ''' ECG made of Gaussian P-QRS-T waves in microvolts
+
+    Params:
+        duration (float) : Seconds
+        heart_rate (float) : Mean heart rate in BPM
+        rr_variability (float) : Relative standard deviation of the RR intervals
+        noise (float) : White noise standard deviation
+        powerline (float) : Amplitude of the powerline hum at powerline_freq Hz
+        baseline (float) : Amplitude of a 0.2 Hz baseline wander
+        emg (float) : Standard deviation of 40-200 Hz band limited muscle noise
+        seed (int)
+
+    Returns:
+        (timestamps, samples, beat times) where beat times are the R-peak times in seconds
+    '''
+    rng = np.random.default_rng(seed)
+    timestamps = np.arange(int(duration * sample_rate)) / sample_rate
+
+    rr = 60.0 / heart_rate * (1 + rr_variability * rng.standard_normal(int(duration * heart_rate / 60) + 2))
+    beat_times = 0.5 + np.concatenate(([0.0], np.cumsum(np.maximum(rr, 0.3))))
+    beat_times = beat_times[beat_times < duration - 0.5]
+
+    # (offset to the R-peak in s, width in s, amplitude) of the P, Q, R, S and T waves
+    waves = ((-0.2, 0.025, 120.0), (-0.03, 0.01, -100.0), (0.0, 0.012, 1000.0), (0.03, 0.015, -150.0),
+             (0.25, 0.05, 200.0))
+    samples = np.zeros_like(timestamps)
+    half_width = int(0.5 * sample_rate)
+    for beat in beat_times:
+        # Every wave is gone half a second away from the R-peak
+        centre = int(beat * sample_rate)
+        window = slice(max(centre - half_width, 0), centre + half_width)
+        t = timestamps[window] - beat
+        for offset, width, amplitude in waves:
+            samples[window] += amplitude * np.exp(-0.5 * ((t - offset) / width) ** 2)
+
+    samples += noise * rng.standard_normal(len(timestamps))
+    samples += powerline * np.sin(2 * np.pi * powerline_freq * timestamps)
+    samples += baseline * np.sin(2 * np.pi * 0.2 * timestamps)
+    if emg > 0:
+        samples += emg * band_limited_noise(len(timestamps), sample_rate, 40.0, 200.0, rng)
+    return timestamps, samples, beat_times
+
+
+def band_limited_noise(count, sample_rate, low, high, rng):
+    ''' Unit variance noise limited to [low, high] Hz (clipped to Nyquist)
+    '''
+    spectrum = np.fft.rfft(rng.standard_normal(count))
+    freqs = np.fft.rfftfreq(count, 1 / sample_rate)
+    spectrum[(freqs < low) | (freqs > high)] = 0
+    noise = np.fft.irfft(spectrum, count)
+    return noise / (noise.std() or 1.0)
+
+
+def pmd_ecg_frames(samples, sample_rate=130, samples_per_frame=73, start_ns=0):
+    ''' Split an ECG signal into uncompressed PMD ECG notifications as sent by the H10
+    '''
+    values = np.round(samples).astype(np.int32)
+    frames = []
+    for start in range(0, len(values) - samples_per_frame + 1, samples_per_frame):
+        chunk = values[start:start + samples_per_frame]
+        timestamp = start_ns + int((start + samples_per_frame - 1) * 1e9 / sample_rate)
+        payload = (chunk.astype('<u4') & 0xFFFFFF).view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        frames.append(bytearray([PMD_ECG]) + timestamp.to_bytes(8, 'little') + bytearray([0x00]) + payload)
+    return frames
+
+
+def match_beats(detected_times, beat_times, tolerance=0.075):
+    ''' Sensitivity and positive predictive value of detected R-peak times against the true beats
+    '''
+    detected_times = np.sort(np.asarray(detected_times, dtype=float))
+    beat_times = np.asarray(beat_times, dtype=float)
+    if len(detected_times) == 0:
+        return 0.0, 0.0
+
+    def matched(times, reference):
+        # Distance to the nearest reference time
+        reference = np.concatenate(([-np.inf], reference, [np.inf]))
+        position = np.searchsorted(reference, times)
+        nearest = np.minimum(times - reference[position - 1], reference[position] - times)
+        return nearest <= tolerance
+
+    sensitivity = matched(beat_times, detected_times).mean()
+    ppv = matched(detected_times, beat_times).mean()
+    return float(sensitivity), float(ppv)
@@ -0,0 +1,20 @@
+import pytest
+
+from benchmark import ACCURACY_SCENARIOS, detection_accuracy
+
+# -----------------------------------------------------------------------------------
+# R-PEAK DETECTION ACCURACY
+# Sensitivity and PPV of the streaming and batch Pan-Tompkins detectors on the synthetic
+# scenarios of benchmark.py, so a detection regression fails `python -m pytest`.
+# -----------------------------------------------------------------------------------
+MIN_ACCURACY = 0.99
+DURATION = 60.0  # seconds of synthetic ECG per scenario
+
+
+@pytest.mark.parametrize("detector", ["stream", "batch"])
+@pytest.mark.parametrize("options", [options for _, options in ACCURACY_SCENARIOS],
+                         ids=[name for name, _ in ACCURACY_SCENARIOS])
+def test_detection_accuracy(options, detector):
+    sensitivity, ppv = detection_accuracy(options, detector, DURATION)
+    assert sensitivity >= MIN_ACCURACY, f"sensitivity {sensitivity:.3f}"
+    assert ppv >= MIN_ACCURACY, f"PPV {ppv:.3f}"
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from emg_features import EMGFeatures
+
+# -----------------------------------------------------------------------------------
+# MULTI-CHANNEL EMG FEATURES
+# -----------------------------------------------------------------------------------
+SAMPLE_RATE = 200
+WINDOW_SIZE = 200  # ten periods of the 10 Hz test sinusoid
+
+
+def sinusoids(amplitudes, frequency=10.0, duration=3.0):
+    t = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.asarray(amplitudes, dtype=float)[:, np.newaxis] * np.sin(2 * np.pi * frequency * t + 0.1)
+
+
+def brute_force(signal, window_size, threshold=0.0):
+    ''' RMS, MAV, ZC and WL of the last window_size samples, the step into the window included
+    '''
+    window = signal[:, -window_size:]
+    previous = signal[:, -window_size - 1:-1]
+    step = np.abs(window - previous)
+    crossings = (window * previous < 0) & (step >= threshold)
+    return np.array((np.sqrt(np.mean(window ** 2, axis=1)), np.mean(np.abs(window), axis=1),
+                     crossings.sum(axis=1), step.sum(axis=1)))
+
+
+def test_known_sinusoid():
+    amplitudes = [1.0, 50.0, 200.0]
+    features = EMGFeatures(len(amplitudes), WINDOW_SIZE)
+    features.update(sinusoids(amplitudes))
+    rms, mav, zc, wl = features.features()
+
+    amplitudes = np.array(amplitudes)
+    np.testing.assert_allclose(rms, amplitudes / np.sqrt(2), rtol=1e-5)
+    np.testing.assert_allclose(mav, 2 * amplitudes / np.pi, rtol=1e-2)
+    np.testing.assert_array_equal(zc, 20)  # two crossings per period
+    np.testing.assert_allclose(wl, 10 * 4 * amplitudes, rtol=2e-2)  # 4 amplitudes per period
+
+
+@pytest.mark.parametrize("threshold", [0.0, 5.0])
+def test_running_sums_match_brute_force_over_random_chunks(threshold):
+    rng = np.random.default_rng(0)
+    signal = rng.standard_normal((8, 3000)) * np.linspace(1, 20, 8)[:, np.newaxis]
+    features = EMGFeatures(8, 50, threshold)
+    start = 0
+    while start < signal.shape[1]:
+        # Chunks shorter and longer than the window, so the ring and the resync are both exercised
+        stop = min(start + int(rng.integers(1, 120)), signal.shape[1])
+        features.update(signal[:, start:stop])
+        start = stop
+        if start > 50:
+            np.testing.assert_allclose(features.features(), brute_force(signal[:, :start], 50, threshold),
+                                       rtol=1e-4, atol=1e-3)
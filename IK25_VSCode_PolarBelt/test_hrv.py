@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from hrv import HRVEngine
+
+# -----------------------------------------------------------------------------------
+# INCREMENTAL HRV ENGINE
+# The running sums are compared with a brute-force recompute over the same window.
+# -----------------------------------------------------------------------------------
+WINDOW_DURATION = 10.0
+
+
+def brute_force(beats, now, window_duration=WINDOW_DURATION):
+    ''' Heart rate, RMSSD and SDNN of the IBIs that end inside [now - window_duration, now]
+    '''
+    ibis = []  # (beat number, beat time, IBI), a rejected beat breaks the chain
+    last_beat = None
+    for number, (beat_time, accepted) in enumerate(beats):
+        if not accepted:
+            last_beat = None
+            continue
+        if last_beat is not None:
+            ibis.append((number, beat_time, beat_time - last_beat))
+        last_beat = beat_time
+    window = [(number, ibi) for number, beat_time, ibi in ibis if now - window_duration <= beat_time <= now]
+    if not window:
+        return 0, 0, 0
+    values = np.array([ibi for _, ibi in window])
+    differences = [(b - a) ** 2 for (first, a), (second, b) in zip(window, window[1:]) if second == first + 1]
+    heart_rate = np.mean(60 / values)
+    rmssd = np.sqrt(np.mean(differences)) if differences else 0
+    sdnn = np.std(values) if len(values) >= 2 else 0
+    return heart_rate, rmssd, sdnn
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_running_sums_match_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    engine = HRVEngine(WINDOW_DURATION)
+    beats = []
+    beat_time = 0.0
+    for number in range(400):
+        beat_time += rng.uniform(0.4, 1.3)
+        if number % 97 == 50:
+            beat_time += 15.0  # signal lost for longer than the window, everything is evicted
+        accepted = rng.random() > 0.1
+        engine.add_beat(beat_time, accepted)
+        beats.append((beat_time, accepted))
+
+        # Evaluate at the beat and between beats, where only the eviction path runs
+        for now in (beat_time, beat_time + rng.uniform(0.0, 0.4)):
+            engine.skip(now)
+            heart_rate, rmssd, sdnn = brute_force(beats, now)
+            assert engine.heart_rate == pytest.approx(heart_rate, abs=1e-9)
+            assert engine.rmssd == pytest.approx(rmssd, abs=1e-9)
+            assert engine.sdnn == pytest.approx(sdnn, abs=1e-9)
+
+
+def test_metrics_need_two_ibis():
+    engine = HRVEngine(WINDOW_DURATION)
+    engine.add_beat(0.0)
+    engine.add_beat(1.0)
+    assert engine.metrics(1.0) == [0, 0, 0]
+    engine.add_beat(1.8)
+    heart_rate, hrv_score, _ = engine.metrics(1.8)
+    assert heart_rate == pytest.approx((60 / 1.0 + 60 / 0.8) / 2)
+    assert hrv_score > 0
+    assert engine.metrics(1.8 + WINDOW_DURATION + 1.0) == [0, 0, 0]
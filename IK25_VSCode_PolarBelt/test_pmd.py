@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from pmd import COMPRESSED_FLAG, PMD_ACC, PMD_ECG, decode_ecg, decode_frame
+
+# -----------------------------------------------------------------------------------
+# PMD FRAME DECODING
+# Frames are built byte by byte here, independently of the vectorized decoder.
+# -----------------------------------------------------------------------------------
+def header(measurement_type, timestamp, frame_type):
+    return bytes([measurement_type]) + timestamp.to_bytes(8, "little") + bytes([frame_type])
+
+
+def pack_signed(values, width):
+    return b"".join(int(value).to_bytes(width, "little", signed=True) for value in values)
+
+
+def pack_deltas(deltas, bit_width):
+    ''' Signed deltas as bit_width bit two's complement values, least significant bit first
+    '''
+    bits = []
+    for delta in deltas:
+        value = int(delta) & ((1 << bit_width) - 1)
+        bits.extend((value >> bit) & 1 for bit in range(bit_width))
+    bits.extend([0] * (-len(bits) % 8))
+    return bytes(sum(bits[i + bit] << bit for bit in range(8)) for i in range(0, len(bits), 8))
+
+
+def test_decode_ecg_24_bit():
+    values = [0, 1, -1, 1234, -1234, 2 ** 23 - 1, -2 ** 23]
+    frame = header(PMD_ECG, 123456789, 0x00) + pack_signed(values, 3)
+
+    ecg = decode_ecg(frame)
+    assert ecg.dtype == np.float32
+    np.testing.assert_array_equal(ecg, values)
+
+    decoded = decode_frame(frame)
+    assert (decoded.measurement_type, decoded.timestamp, decoded.compressed) == (PMD_ECG, 123456789, False)
+    np.testing.assert_array_equal(decoded.samples[:, 0], values)
+
+
+@pytest.mark.parametrize("frame_type, width", [(0x01, 2), (0x02, 3)])
+def test_delta_frame_round_trip(frame_type, width):
+    rng = np.random.default_rng(frame_type)
+    channels = 3
+    reference = np.array([100, -2000, 30000])
+    blocks = []
+    payload = b""
+    for bit_width, sample_count in ((1, 4), (5, 7), (12, 10), (16, 3)):
+        limit = 1 << (bit_width - 1)
+        deltas = rng.integers(-limit, limit, size=(sample_count, channels))
+        blocks.append(deltas)
+        payload += bytes([bit_width, sample_count]) + pack_deltas(deltas.ravel(), bit_width)
+    frame = header(PMD_ACC, 42, frame_type | COMPRESSED_FLAG) + pack_signed(reference, width) + payload
+
+    decoded = decode_frame(frame)
+    expected = np.cumsum(np.concatenate([reference[np.newaxis, :]] + blocks), axis=0)
+    assert decoded.compressed and decoded.frame_type == frame_type
+    assert decoded.samples.shape == (1 + sum(len(block) for block in blocks), channels)
+    np.testing.assert_array_equal(decoded.samples, expected)
+
+
+def test_delta_frame_ignores_truncated_block():
+    reference = [10, 20, 30]
+    block = bytes([4, 2]) + pack_deltas([1, -2, 3, -4, 5, -6], 4)
+    frame = header(PMD_ACC, 0, 0x01 | COMPRESSED_FLAG) + pack_signed(reference, 2) + block + bytes([8, 5, 1])
+
+    samples = decode_frame(frame).samples
+    np.testing.assert_array_equal(samples, [[10, 20, 30], [11, 18, 33], [7, 23, 27]])
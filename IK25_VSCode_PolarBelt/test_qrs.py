@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from qrs import QRSBlanker
+from synthetic import band_limited_noise, synthetic_ecg
+
+# -----------------------------------------------------------------------------------
+# QRS REMOVAL
+# ECG and EMG are generated separately, so the residual under the QRS complexes is
+# what the blanker leaves of the ECG plus what it destroys of the EMG.
+# -----------------------------------------------------------------------------------
+def qrs_residuals(sample_rate, method, chunk_duration=None):
+    t, ecg, beats = synthetic_ecg(60, sample_rate=sample_rate, noise=0.0, powerline=0.0, baseline=0.0)
+    emg = 50.0 * band_limited_noise(len(t), sample_rate, 40.0, 200.0, np.random.default_rng(1))
+    signal = ecg + emg
+    peaks = np.round(beats * sample_rate).astype(int)
+
+    blanker = QRSBlanker(sample_rate, method=method)
+    blanker.add_peaks(0, peaks)
+    if chunk_duration is None:
+        cleaned = blanker.update(signal[np.newaxis, :], 0)[0]
+    else:
+        # Streaming like the pipeline: every segment reaches `context` samples past the part that is kept
+        chunk_size = int(chunk_duration * sample_rate)
+        parts = []
+        for start in range(0, len(signal), chunk_size):
+            segment_start = max(start - blanker.context, 0)
+            segment_end = min(start + chunk_size + blanker.context, len(signal))
+            cleaned = blanker.update(signal[np.newaxis, segment_start:segment_end], segment_start)[0]
+            parts.append(cleaned[start - segment_start:start - segment_start + chunk_size])
+        cleaned = np.concatenate(parts)
+
+    # Only beats after the template has settled
+    gap = np.zeros(len(t), dtype=bool)
+    for peak in peaks[10:]:
+        gap[peak - blanker.before:peak + blanker.after] = True
+    rms = lambda values: np.sqrt(np.mean(values[gap] ** 2))
+    return rms(cleaned - emg), rms(signal - emg)
+
+
+@pytest.mark.parametrize("method", ["interpolate", "template"])
+def test_qrs_complexes_are_removed(method):
+    residual, unblanked = qrs_residuals(500, method)
+    assert residual < 0.2 * unblanked
+
+
+def test_template_leaves_less_residual_than_interpolation_at_500_hz():
+    template, _ = qrs_residuals(500, "template")
+    interpolate, _ = qrs_residuals(500, "interpolate")
+    assert template < 0.7 * interpolate
+
+
+def test_streamed_template_is_as_good_as_one_pass():
+    streamed, unblanked = qrs_residuals(500, "template", chunk_duration=0.1)
+    one_pass, _ = qrs_residuals(500, "template")
+    assert streamed < 0.2 * unblanked
+    assert streamed < 1.1 * one_pass
@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from recording import Recorder, load_recording, replay_batch
+
+# -----------------------------------------------------------------------------------
+# RECORD AND REPLAY
+# -----------------------------------------------------------------------------------
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "session")
+    samples = np.arange(26, dtype=np.float32).reshape(13, 2)
+    with Recorder(path, 130, 2) as recorder:
+        recorder.write(samples[:6], np.arange(6) / 130)
+        recorder.write(samples[6:], np.arange(6, 13) / 130)
+    loaded, timestamps, meta = load_recording(path)
+    np.testing.assert_array_equal(loaded, samples)
+    np.testing.assert_array_equal(timestamps, np.arange(13) / 130)
+    assert meta["channel_count"] == 2 and meta["sample_rate"] == 130
+
+
+def test_existing_recording_is_not_appended_to(tmp_path):
+    path = str(tmp_path / "session")
+    with Recorder(path, 130, 1) as recorder:
+        recorder.write(np.zeros(13), np.arange(13) / 130)
+    with pytest.raises(FileExistsError):
+        Recorder(path, 130, 1)
+    assert len(load_recording(path)[1]) == 13
+
+
+def test_empty_recording_loads(tmp_path):
+    path = str(tmp_path / "session")
+    with Recorder(path, 130, 2):
+        pass
+    samples, timestamps, _ = load_recording(path)
+    assert samples.shape == (0, 2) and timestamps.shape == (0,)
+
+
+def test_batch_replay_checks_the_ecg_channels(tmp_path):
+    path = str(tmp_path / "session")
+    with Recorder(path, 130, 1) as recorder:
+        recorder.write(np.zeros(13), np.arange(13) / 130)
+    with pytest.raises(ValueError, match=r"ECG channels \[1\]"):
+        replay_batch(path, selected_channels=[0, 1])
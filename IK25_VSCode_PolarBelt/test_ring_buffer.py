@@ -0,0 +1,59 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+
+# -----------------------------------------------------------------------------------
+# RING BUFFER
+# Sample values encode their absolute index, so every window can be checked exactly.
+# -----------------------------------------------------------------------------------
+def chunk(start, stop, channel_count=2):
+    index = np.arange(start, stop)
+    samples = index[:, np.newaxis] + 1000 * np.arange(channel_count)
+    return samples, index / 10.0
+
+
+def test_wrap_around_keeps_the_newest_samples_in_order():
+    ring = RingBuffer(2, 8)
+    for start in range(0, 23, 5):
+        ring.extend(*chunk(start, min(start + 5, 23)))
+
+    assert ring.count == 23 and len(ring) == 8 and ring.start == 15
+    expected, expected_timestamps = chunk(15, 23)
+    np.testing.assert_array_equal(ring.samples(), expected.T)
+    np.testing.assert_array_equal(ring.timestamps(), expected_timestamps)
+    np.testing.assert_array_equal(ring.samples(3), expected.T[:, -3:])
+
+
+def test_windows_are_contiguous_views():
+    ring = RingBuffer(2, 8)
+    ring.extend(*chunk(0, 13))
+    window = ring.samples()
+    assert np.shares_memory(window, ring._samples)
+    assert all(row.flags.c_contiguous for row in window)
+    assert ring.timestamps().flags.c_contiguous
+    assert np.shares_memory(ring.timestamps(), ring._timestamps)
+
+
+def test_since_cursor_and_lookups():
+    ring = RingBuffer(2, 8)
+    ring.extend(*chunk(0, 6))
+    cursor = ring.count
+    ring.extend(*chunk(6, 10))
+    samples, timestamps = ring.since(cursor)
+    np.testing.assert_array_equal(samples[0], np.arange(6, 10))
+    np.testing.assert_array_equal(timestamps, np.arange(6, 10) / 10.0)
+
+    # A cursor older than the buffer only returns what is still there
+    samples, _ = ring.since(0)
+    np.testing.assert_array_equal(samples[0], np.arange(2, 10))
+
+    np.testing.assert_array_equal(ring.timestamps_at([2, 9]), [0.2, 0.9])
+    assert ring.index_of(0.45) == 5
+
+
+def test_chunk_longer_than_capacity():
+    ring = RingBuffer(2, 8)
+    ring.extend(*chunk(0, 3))
+    ring.extend(*chunk(3, 30))
+    assert ring.count == 30
+    np.testing.assert_array_equal(ring.samples()[0], np.arange(22, 30))
@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from sensor_clock import SensorClock
+
+# -----------------------------------------------------------------------------------
+# SENSOR CLOCK
+# A simulated H10 whose clock runs fast against local_clock(), with random BLE delays.
+# -----------------------------------------------------------------------------------
+SAMPLE_RATE = 130
+FRAME_SIZE = 73
+SKEW = 2e-4  # the sensor clock runs 200 ppm fast
+DELAY = 0.02  # mean BLE delivery delay in seconds
+
+
+def frames(count, rng, sensor_start_ns=5 * 10 ** 12, local_offset=1000.0, first_delay=None):
+    ''' (sensor timestamp of the last sample in ns, sample times on local_clock(), arrival time) per frame
+    '''
+    true_period = 1.0 / (SAMPLE_RATE * (1 + SKEW))  # seconds of local time between samples
+    for frame in range(count):
+        sample_numbers = frame * FRAME_SIZE + np.arange(FRAME_SIZE)
+        local_times = local_offset + sample_numbers * true_period
+        sensor_timestamp = sensor_start_ns + int(round(sample_numbers[-1] * 1e9 / SAMPLE_RATE))
+        delay = DELAY + rng.exponential(0.01) - 0.01
+        if frame == 0 and first_delay is not None:
+            delay = first_delay
+        yield sensor_timestamp, local_times, local_times[-1] + delay
+
+
+def test_drift_is_followed():
+    rng = np.random.default_rng(0)
+    clock = SensorClock(SAMPLE_RATE)
+    errors = []
+    for sensor_timestamp, local_times, arrival_time in frames(1500, rng):
+        stamps = clock.timestamps(sensor_timestamp, FRAME_SIZE, arrival_time)
+        errors.append(np.max(np.abs(stamps - local_times - DELAY)))
+
+    assert clock.slope == pytest.approx(1 / (1 + SKEW), abs=2e-5)
+    assert clock.sample_period == pytest.approx(1.0 / SAMPLE_RATE, rel=1e-6)
+    # After the first minutes the timestamps only carry the average delivery delay
+    assert max(errors[-500:]) < 0.005
+    assert clock.gaps == 0 and clock.lost_samples == 0
+
+
+def test_offset_recovers_from_a_late_first_frame():
+    rng = np.random.default_rng(1)
+    clock = SensorClock(SAMPLE_RATE)
+    errors = []
+    for sensor_timestamp, local_times, arrival_time in frames(1500, rng, first_delay=0.5):
+        stamps = clock.timestamps(sensor_timestamp, FRAME_SIZE, arrival_time)
+        errors.append(np.max(np.abs(stamps - local_times - DELAY)))
+    assert errors[0] > 0.4
+    assert max(errors[-500:]) < 0.005
+
+
+def test_lost_frames_are_counted():
+    rng = np.random.default_rng(2)
+    clock = SensorClock(SAMPLE_RATE)
+    for frame, (sensor_timestamp, _, arrival_time) in enumerate(frames(20, rng)):
+        if frame in (5, 6):
+            continue
+        clock.timestamps(sensor_timestamp, FRAME_SIZE, arrival_time)
+    assert clock.gaps == 1
+    assert clock.lost_samples == 2 * FRAME_SIZE
+    assert clock.frames == 18
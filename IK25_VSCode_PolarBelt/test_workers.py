@@ -0,0 +1,63 @@
+import numpy as np
+
+from ring_buffer import RingBuffer
+from workers import SharedRingBuffer
+
+# -----------------------------------------------------------------------------------
+# SHARED RING BUFFER
+# Sample values equal their absolute index, so torn or missing samples are easy to spot.
+# -----------------------------------------------------------------------------------
+def chunk(start, stop):
+    values = np.arange(start, stop)
+    return values[:, np.newaxis].astype(np.float32), values.astype(np.float64)
+
+
+def test_reader_lapped_by_writer_gets_newest_contiguous_samples():
+    writer = SharedRingBuffer(1, 10)
+    reader = SharedRingBuffer(1, 10, name=writer.name)
+    try:
+        for start in range(0, 25, 7):
+            writer.extend(*chunk(start, min(start + 7, 25)))
+        samples, timestamps, cursor = reader.read_since(0)
+        np.testing.assert_array_equal(timestamps, np.arange(15, 25))
+        np.testing.assert_array_equal(samples[:, 0], timestamps)
+        assert cursor == 25
+
+        samples, timestamps, cursor = reader.read_since(cursor)
+        assert len(timestamps) == 0 and cursor == 25
+    finally:
+        reader.close()
+        writer.close(unlink=True)
+
+
+def test_read_during_write_drops_samples_being_overwritten(monkeypatch):
+    writer = SharedRingBuffer(1, 10)
+    reader = SharedRingBuffer(1, 10, name=writer.name)
+    reads = []
+    original_extend = RingBuffer.extend
+
+    def interrupted_extend(ring, samples, timestamps):
+        # The writer has announced the write and clobbered the first slot when the reader copies
+        position = ring.count % ring.capacity
+        ring._samples[:, [position, position + ring.capacity]] = -1
+        reads.append(reader.read_since(0))
+        original_extend(ring, samples, timestamps)
+
+    try:
+        writer.extend(*chunk(0, 12))
+        monkeypatch.setattr(RingBuffer, "extend", interrupted_extend)
+        writer.extend(*chunk(12, 16))
+
+        samples, timestamps, cursor = reads[0]
+        assert int(writer._write_end[0]) == 16 and cursor == 12
+        # Indices 2-5 share their slots with 12-15 that were being written, only 6-11 are safe
+        np.testing.assert_array_equal(timestamps, np.arange(6, 12))
+        np.testing.assert_array_equal(samples[:, 0], timestamps)
+
+        samples, timestamps, cursor = reader.read_since(cursor)
+        np.testing.assert_array_equal(timestamps, np.arange(12, 16))
+        np.testing.assert_array_equal(samples[:, 0], timestamps)
+        assert cursor == 16 == int(writer._write_end[0])
+    finally:
+        reader.close()
+        writer.close(unlink=True)
@@ -0,0 +1,189 @@
+import multiprocessing
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instrumentation import INSTRUMENTS
+from ring_buffer import RingBuffer
+from scheduler import DeadlineClock
+
+# -----------------------------------------------------------------------------------
+# PROCESS BACKEND
+# The detect/metrics/EMG stages run in a worker process. Raw samples reach it through a
+# ring buffer in shared memory, only the small per-tick results travel back over a queue.
+# -----------------------------------------------------------------------------------
+class SharedRingBuffer(RingBuffer):
+    """ RingBuffer whose samples, timestamps and write count live in shared memory.
+
+    One process writes with extend(), other processes attach by name and read with
+    read_since(). Like a seqlock, the writer announces the count it is writing up to
+    before it touches the samples and only advances the write count once they are in
+    place, so a reader can tell which of the samples it copied may have been overwritten.
+
+    Params:
+        channel_count (int)
+        capacity (int) : Number of samples kept
+        name (str) : Name of an existing block to attach to, None creates a new one
+    """
+    def __init__(self, channel_count, capacity, name=None):
+        self.channel_count = channel_count
+        self.capacity = capacity
+        samples_size = channel_count * 2 * capacity * 4
+        timestamps_size = 2 * capacity * 8
+        create = name is None
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=16 + timestamps_size + samples_size)
+        self.name = self.shm.name
+        self._count = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf)
+        self._write_end = np.ndarray((1,), dtype=np.int64, buffer=self.shm.buf, offset=8)
+        self._timestamps = np.ndarray((2 * capacity,), dtype=np.float64, buffer=self.shm.buf, offset=16)
+        self._samples = np.ndarray((channel_count, 2 * capacity), dtype=np.float32, buffer=self.shm.buf,
+                                   offset=16 + timestamps_size)
+        if create:
+            self._count[0] = 0
+            self._write_end[0] = 0
+
+    @property
+    def count(self):
+        return int(self._count[0])
+
+    @count.setter
+    def count(self, value):
+        self._count[0] = value
+
+    def extend(self, samples, timestamps):
+        # Announce the write first, the samples up to write_end - capacity may be overwritten from here on.
+        # This relies on the plain numpy stores reaching the shared memory in program order: the write_end
+        # store before the samples, the samples before the count. That holds for CPython on x86-64, whose
+        # stores are not reordered with each other. Weaker memory models (e.g. ARM) give no such guarantee.
+        self._write_end[0] = self.count + len(timestamps)
+        super().extend(samples, timestamps)
+
+    def read_since(self, cursor):
+        ''' Copy the samples written after `cursor`
+
+        Returns:
+            (samples (samples, channels), timestamps, new cursor). Samples the writer overwrote,
+            or had started to overwrite, while they were copied are dropped.
+        '''
+        count = self.count
+        start = max(cursor, count - min(count, self.capacity))
+        end = count % self.capacity + (self.capacity if count >= self.capacity else 0)
+        window = slice(end - (count - start), end)
+        samples = self._samples[:, window].T.copy()
+        timestamps = self._timestamps[window].copy()
+
+        # The writer may have lapped the oldest copied samples in the meantime, or be doing so right now
+        overwritten = int(self._write_end[0]) - self.capacity - start
+        if overwritten > 0:
+            samples = samples[overwritten:]
+            timestamps = timestamps[overwritten:]
+        return samples, timestamps, count
+
+    def close(self, unlink=False):
+        self._count = self._write_end = self._timestamps = self._samples = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+
+
+def dsp_worker(ring_name, channel_count, capacity, sample_rate, pipeline_options, results, stop, tick_interval,
+               diagnostics=None):
+    ''' Worker process: read new samples from the shared ring, run the pipeline and queue the results.
+    With a `diagnostics` queue the instrumentation of the worker is sent there about once per second.
+    '''
+    from pipeline import ProcessingPipeline, Tick
+
+    ring = SharedRingBuffer(channel_count, capacity, name=ring_name)
+    pipeline = ProcessingPipeline(sample_rate, channel_count, **pipeline_options)
+    cursor = 0
+    clock = DeadlineClock(tick_interval, name="worker_tick")
+    if diagnostics is not None:
+        INSTRUMENTS.enable()
+        next_report = time.monotonic() + 1.0
+    try:
+        while not stop.is_set():
+            previous_cursor = cursor
+            samples, timestamps, cursor = ring.read_since(cursor)
+            if diagnostics is not None:
+                INSTRUMENTS.count("ring_overwritten", cursor - previous_cursor - len(timestamps))
+                if time.monotonic() >= next_report:
+                    diagnostics.put(INSTRUMENTS.drain())
+                    next_report += 1.0
+            if len(timestamps) > 0:
+                pipeline.ingest(samples, timestamps)
+                if pipeline.ready:
+                    tick = pipeline.tick()
+                    # Only what the outlets need goes back, not the whole window
+                    count = tick.new_sample_count
+                    results.put(Tick(
+                        tick.timestamps[-1:],
+                        None,
+                        None,
+                        tick.metrics,
+                        tick.envelopes[:, tick.envelopes.shape[1] - count:],
+                        tick.envelope_timestamps[len(tick.envelope_timestamps) - count:],
+                        count,
+                        tick.beats
+                    ))
+            clock.wait()
+    finally:
+        ring.close()
+
+
+class ProcessBackend:
+    """ Runs the detect, metrics and EMG stages of a ProcessingPipeline in a separate process.
+
+    push() writes raw samples into a shared memory ring, results() returns the Ticks computed
+    since the last call. Result Ticks only hold the newest timestamp, the metrics, the new beats
+    and the new EMG samples, they can be passed to Publisher.publish() like a full Tick.
+
+    Params:
+        sample_rate (int)
+        channel_count (int) : Channels of the incoming stream
+        capacity (int) : Samples kept in the shared ring, should cover a few ticks
+        compute_rate (float) : Ticks per second of the worker
+        **pipeline_options : Passed on to ProcessingPipeline
+    """
+    def __init__(self, sample_rate, channel_count, capacity=None, compute_rate=10.0, **pipeline_options):
+        context = multiprocessing.get_context("spawn")
+        self.ring = SharedRingBuffer(channel_count, capacity or int(10 * sample_rate))
+        self._results = context.Queue()
+        self._stop = context.Event()
+        # The worker only reports its stage timings when instrumentation is on in this process
+        self._diagnostics = context.Queue() if INSTRUMENTS.enabled else None
+        self.worker = context.Process(
+            target=dsp_worker,
+            args=(self.ring.name, channel_count, self.ring.capacity, sample_rate, pipeline_options,
+                  self._results, self._stop, 1.0 / compute_rate, self._diagnostics),
+            daemon=True
+        )
+        self.worker.start()
+
+    def push(self, samples, timestamps):
+        ''' Hand over a chunk as returned by pull_chunk
+        '''
+        self.ring.extend(samples, timestamps)
+
+    def results(self):
+        if self._diagnostics is not None:
+            while True:
+                try:
+                    INSTRUMENTS.merge(self._diagnostics.get_nowait())
+                except queue.Empty:
+                    break
+        ticks = []
+        while True:
+            try:
+                ticks.append(self._results.get_nowait())
+            except queue.Empty:
+                INSTRUMENTS.gauge("result_backlog", len(ticks))
+                return ticks
+
+    def close(self):
+        self._stop.set()
+        self.worker.join(timeout=2.0)
+        if self.worker.is_alive():
+            self.worker.terminate()
+        self.ring.close(unlink=True)